@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('advertise', '0003_otherclassified_othermotors_otherpropertyforrent_otherpropertyforsale'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdvertiseBase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(max_length=32)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(choices=[('Addis ababa', 'Addis Ababa'), ('Mekelle', 'Mekelle'), ('Gondar', 'Gondar'), ('Adama', 'Adama'), ('Awassa', 'Awassa'), ('Bahir dar', 'Bahir Dar'), ('Dire dawa', 'Dire Dawa'), ('Sodo', 'Sodo'), ('Dessie', 'Dessie'), ('Jimma', 'Jimma'), ('Jijiga', 'Jijiga'), ('Shashemene', 'Shashemene'), ('Bishoftu', 'Bishoftu'), ('Arba minch', 'Arbaminch'), ('Hosana', 'Hosana'), ('Harar', 'Harar'), ('Dilla', 'Dilla'), ('Debre birhan', 'Debre Birhan'), ('Asella', 'Asella'), ('Debre marqos', 'Debremarqos'), ('Kombolcha', 'Kombolcha'), ('Debre tabor', 'Debretabor'), ('Adigrat', 'Adigrat'), ('Weldiya', 'Weldiya'), ('Sebeta', 'Sebeta'), ('Ambo', 'Ambo'), ('Arsi', 'Arsi'), ('Gurage', 'Gurage'), ('Gambella', 'Gambella')], max_length=32)),
+            ],
+            options={
+                'verbose_name_plural': 'Cities',
+            },
+        ),
+    ]
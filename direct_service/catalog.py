@@ -0,0 +1,134 @@
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .models import Feature, Service, ServiceField
+
+VERSION_KEY = "service_catalog:version"
+
+
+class CatalogDocument:
+    """A catalog response rendered once to JSON bytes, with the ETag of the catalog version it came from."""
+
+    def __init__(self, data, etag):
+        self.body = JSONRenderer().render(data)
+        self.etag = etag
+
+    def as_response(self, request):
+        if self.etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(self.body, content_type="application/json")
+        response["ETag"] = self.etag
+        return response
+
+
+class Catalog:
+    """
+    Every Service, Feature and ServiceField at one catalog version. Documents come in two variants:
+    everything for admins and only active services and features for everyone else. The field
+    representations are shared between responses and must not be modified.
+    """
+
+    def __init__(self, version, services, features, service_fields):
+        from .serializers import ServiceFieldSerializer
+
+        self.version = version
+        self.parent_ids = {service.parent_id for service in services if service.parent_id}
+        self.service_fields = defaultdict(list)
+        for service_field, data in zip(service_fields, ServiceFieldSerializer(service_fields, many=True).data):
+            self.service_fields[service_field.service_feature_id].append(data)
+        self.documents = {}
+        for everything in (True, False):
+            variant = "all" if everything else "active"
+            # admins list services newest first, everyone else in id order, as the viewsets do
+            visible_services = services if everything else sorted(
+                (service for service in services if service.is_active), key=lambda service: service.id
+            )
+            visible_features = [feature for feature in features if everything or feature.is_active]
+            self.documents["service-dropdown", everything] = CatalogDocument(
+                [{"id": service.id, "name": service.name} for service in visible_services if not service.parent_id],
+                f'"{version}-service-dropdown-{variant}"'
+            )
+            self.documents["feature-dropdown", everything] = CatalogDocument(
+                [{"id": feature.id, "name": feature.name, "service__name": feature.service.name} for feature in visible_features],
+                f'"{version}-feature-dropdown-{variant}"'
+            )
+            self.documents["tree", everything] = CatalogDocument(
+                self._tree(visible_services, visible_features), f'"{version}-tree-{variant}"'
+            )
+
+    def _tree(self, services, features):
+        features_by_service = defaultdict(list)
+        for feature in features:
+            features_by_service[feature.service_id].append({
+                "id": feature.id,
+                "name": feature.name,
+                "cover_photo": feature.cover_photo.url if feature.cover_photo else None,
+                "description": feature.description,
+                "is_active": feature.is_active,
+                "cities": feature.cities,
+                "service_fields": self.service_fields.get(feature.id, []),
+            })
+        children = defaultdict(list)
+        for service in services:
+            children[service.parent_id].append(service)
+
+        def build(service):
+            return {
+                "id": service.id,
+                "name": service.name,
+                "cover_photo": service.cover_photo.url if service.cover_photo else None,
+                "description": service.description,
+                "is_active": service.is_active,
+                "features": features_by_service.get(service.id, []),
+                "sub_services": [build(child) for child in children.get(service.id, [])],
+            }
+
+        return [build(service) for service in children.get(None, [])]
+
+    def get_document(self, name, everything=False):
+        return self.documents[name, everything]
+
+
+_catalog = None
+
+
+def get_catalog_version():
+    return cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_catalog():
+    """
+    The catalog at the current version. The version lives in the shared cache so a write made by
+    one worker reaches all of them; until it changes, reading the catalog runs no queries.
+    """
+    global _catalog
+    version = get_catalog_version()
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = Catalog(
+            version,
+            list(Service.objects.order_by("-created")),
+            list(Feature.objects.select_related("service").order_by("id")),
+            list(ServiceField.objects.order_by("id")),
+        )
+        _catalog = catalog
+    return catalog
+
+
+def get_context_catalog(context):
+    """get_catalog() once per serializer context, so a list checks the version once instead of per row."""
+    if "catalog" not in context:
+        context["catalog"] = get_catalog()
+    return context["catalog"]
+
+
+def invalidate_catalog():
+    """Move every worker to a new catalog version once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None))
@@ -23,6 +23,12 @@ class ServiceRequestStatusChoices(models.TextChoices):
     COMPLETED_BY_PROVIDER = 'completed-by-provider'
     COMPLETED = 'completed'
     
+class ProviderInboxReasonChoices(models.TextChoices):
+    AVAILABLE = "available"
+    ASSIGNED = "assigned"
+    PARENT_ASSIGNED = "parent-assigned"
+    REJECTED = "rejected"
+
 class ServiceRequestRatingTypeChoices(models.TextChoices):
     FROM_EMPLOYEE = "from-employee"
     FROM_CLIENT = "from-client"
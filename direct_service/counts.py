@@ -0,0 +1,87 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from flogapp.accounts.choices import RoleChoices
+from .models import ServiceProviderInbox, ServiceRequest
+
+COUNT_CACHE_TIMEOUT = 60
+GENERATION_KEY = "service_request_count:generation:{}"
+# roles whose request list is scoped to the user; everyone else counts every request
+SCOPED_ROLES = (
+    RoleChoices.SERVICE_PROVIDER, RoleChoices.SERVICE_PROVIDER_EMPLOYEE, RoleChoices.CLIENT, RoleChoices.FREELANCER
+)
+
+
+def _scope(user):
+    return f"user:{user.id}" if user.role in SCOPED_ROLES else "all"
+
+
+def get_request_count(user, params, compute):
+    """
+    The count ``compute()`` returns for ``user`` and the filter ``params``, cached until a request
+    the user can see changes (or COUNT_CACHE_TIMEOUT passes).
+    """
+    scope = _scope(user)
+    generation = cache.get_or_set(GENERATION_KEY.format(scope), "0", timeout=None)
+    signature = hashlib.md5(json.dumps(sorted(params.items())).encode()).hexdigest()
+    key = f"service_request_count:{scope}:{generation}:{signature}"
+    count = cache.get(key)
+    if count is None:
+        count = compute()
+        cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def invalidate_user_counts(user_ids):
+    token = uuid.uuid4().hex
+    cache.set_many({GENERATION_KEY.format(f"user:{user_id}"): token for user_id in user_ids}, timeout=None)
+
+
+def _viewer_ids(service_request_ids):
+    """The requesters, assigned employees and inbox providers of the requests, as they are right now."""
+    requests = ServiceRequest.objects.filter(id__in=service_request_ids)
+    user_ids = set(requests.values_list("requester_id", flat=True))
+    user_ids.update(requests.filter(assign__isnull=False).values_list("assign", flat=True))
+    user_ids.update(ServiceProviderInbox.objects.filter(
+        service_request_id__in=service_request_ids
+    ).values_list("service_provider__user_id", flat=True))
+    user_ids.discard(None)
+    return user_ids
+
+
+def invalidate_request_counts(service_request_ids, user_ids=()):
+    """
+    Expire the counts of everyone who can see the requests (requester, assigned employees, providers
+    with an inbox row), of ``user_ids``, and the unscoped counts, once the transaction commits. The
+    viewers are read both now and after commit: call this before closing inbox rows or deleting the
+    requests, so the users who lose them are expired along with those who gain them.
+    """
+    service_request_ids = list(service_request_ids)
+    before = _viewer_ids(service_request_ids) | set(user_ids)
+
+    def invalidate():
+        invalidate_user_counts(before | _viewer_ids(service_request_ids))
+        cache.set(GENERATION_KEY.format("all"), uuid.uuid4().hex, timeout=None)
+
+    transaction.on_commit(invalidate)
+
+
+def estimate_request_count():
+    """The planner's row estimate for the ServiceRequest table, or None where the backend keeps none."""
+    table = ServiceRequest._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table]
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
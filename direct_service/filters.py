@@ -1,8 +1,8 @@
 from django.db.models import Q
 from django_filters import rest_framework as filters
 from flogapp.accounts.choices import RoleChoices
-from .choices import ServiceRequestStatusChoices
-from .models import Service, Feature, ServiceRequest, ServiceProvider
+from .choices import ServiceRequestStatusChoices, ProviderInboxReasonChoices
+from .models import Service, Feature, ServiceRequest, ServiceProvider, ServiceProviderInbox
 
 
 class ServiceFilter(filters.FilterSet):
@@ -54,9 +54,12 @@ class ServiceRequestFilter(filters.FilterSet):
             value = value.split(",")
         except:
             value = [value]
-        print(self.request.user.role)
-        if self.request.user.role==RoleChoices.SERVICE_PROVIDER and ServiceRequestStatusChoices.APPROVED in value:
-            queryset = queryset.exclude(service_provider_rejected=self.request.user.service_provider)
+        if self.request.user.role==RoleChoices.SERVICE_PROVIDER:
+            # served from the provider's inbox index; requests the provider rejected are not offered again
+            inbox = ServiceProviderInbox.objects.filter(
+                service_provider=self.request.user.service_provider, status__in=value
+            ).exclude(status=ServiceRequestStatusChoices.APPROVED, reason=ProviderInboxReasonChoices.REJECTED)
+            return queryset.filter(id__in=inbox.values("service_request"))
         return queryset.filter(status__in=value)
         
     class Meta:
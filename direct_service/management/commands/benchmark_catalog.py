@@ -0,0 +1,86 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from flogapp.services.catalog import VERSION_KEY, get_catalog
+from flogapp.services.choices import FieldTypeChoices
+from flogapp.services.models import Feature, Service, ServiceField
+from flogapp.services.serializers import ServiceFieldSerializer
+
+renderer = JSONRenderer()
+
+
+def read_from_queries(page):
+    # both dropdowns, has_child_services and service_fields for a page, as served before the catalog
+    body = renderer.render(list(Service.objects.filter(is_active=True, parent__isnull=True).values("id", "name")))
+    body += renderer.render(list(Feature.objects.filter(is_active=True).values("id", "name", "service__name")))
+    for service, feature in page:
+        service.sub_services.exists()
+        body += renderer.render(ServiceFieldSerializer(feature.service_fields.all(), many=True).data)
+    return body
+
+
+def read_from_catalog(page):
+    catalog = get_catalog()
+    body = catalog.get_document("service-dropdown").body + catalog.get_document("feature-dropdown").body
+    for service, feature in page:
+        service.id in catalog.parent_ids
+        body += renderer.render(catalog.service_fields.get(feature.id, []))
+    return body
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and time per catalog read (both dropdowns plus has_child_services and "
+        "service_fields for a page of 20) with and without the catalog snapshot. Rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--services", type=int, default=50)
+        parser.add_argument("--features", type=int, default=10, help="features per service")
+        parser.add_argument("--fields", type=int, default=8, help="fields per feature")
+        parser.add_argument("--number", type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options)
+            # a fresh version makes this process build from the seeded rows; other workers rebuild once
+            cache.delete(VERSION_KEY)
+            page = list(zip(Service.objects.filter(is_active=True)[:20], Feature.objects.filter(is_active=True)[:20]))
+            for name, read in (("queries", read_from_queries), ("catalog", read_from_catalog)):
+                read(page)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options["number"]):
+                        read(page)
+                    elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:<8} {len(queries) / options['number']:5.1f} queries/read  "
+                    f"{elapsed / options['number'] * 1000:7.2f} ms/read"
+                )
+            transaction.set_rollback(True)
+        cache.delete(VERSION_KEY)
+
+    def seed(self, options):
+        Service.objects.bulk_create([
+            Service(name=f"Service {index}", cover_photo="services/cover.png") for index in range(options["services"])
+        ])
+        parents = list(Service.objects.order_by("-id")[:options["services"]])
+        Service.objects.bulk_create([
+            Service(name=f"{parent.name} child", parent=parent, cover_photo="services/cover.png") for parent in parents[::2]
+        ])
+        Feature.objects.bulk_create([
+            Feature(service=parent, name=f"{parent.name} feature {index}", cover_photo="services/cover.png", cities=[])
+            for parent in parents for index in range(options["features"])
+        ])
+        ServiceField.objects.bulk_create([
+            ServiceField(
+                service_feature=feature, field_name=f"field_{index}", label=f"Field {index}", field_type=FieldTypeChoices.INTEGER,
+                is_price_unit_field=index == 0, price_per_unit=1 if index == 0 else None
+            )
+            for feature in Feature.objects.filter(service__in=parents) for index in range(options["fields"])
+        ])
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flogapp.accounts.choices import CurrentCityChoices
+from flogapp.services.models import Service, ServiceProvider, ServiceProviderTarget
+from flogapp.services.notifications import MULTICAST_LIMIT, FakeFCMSender
+
+
+class Command(BaseCommand):
+    help = ("Load synthetic targeting rows for one service across all cities and time a new-job alert "
+            "broadcast to every token against the paged fan-out to one city. Nothing is kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tokens", type=int, default=50000)
+        parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per FCM call.")
+
+    def handle(self, *args, **options):
+        service = Service.objects.first()
+        service_provider = ServiceProvider.objects.first()
+        if not service or not service_provider:
+            self.stderr.write("Needs at least one Service and one ServiceProvider.")
+            return
+        cities = CurrentCityChoices.values
+        with transaction.atomic():
+            ServiceProviderTarget.objects.bulk_create([
+                ServiceProviderTarget(
+                    service=service, city=cities[index % len(cities)],
+                    service_provider=service_provider, device_token=f"benchmark-token-{index}"
+                )
+                for index in range(options["tokens"])
+            ], batch_size=5000)
+
+            def broadcast(sender):
+                tokens = list(ServiceProviderTarget.objects.filter(service=service).values_list("device_token", flat=True))
+                for start in range(0, len(tokens), MULTICAST_LIMIT):
+                    sender.send_multicast(tokens[start:start + MULTICAST_LIMIT], "New Job", "")
+
+            def fan_out(sender):
+                for tokens in ServiceProviderTarget.objects.iter_token_pages(service.id, [cities[0]]):
+                    sender.send_multicast(tokens, "New Job", "")
+
+            for label, run in (("broadcast", broadcast), ("fan-out", fan_out)):
+                sender = FakeFCMSender(latency=options["latency"])
+                started = time.perf_counter()
+                run(sender)
+                elapsed = (time.perf_counter() - started) * 1000
+                self.stdout.write(f"{label:<10} {sender.tokens:>7} tokens in {sender.calls:>4} calls  {elapsed:8.1f} ms")
+            transaction.set_rollback(True)
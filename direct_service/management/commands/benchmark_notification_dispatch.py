@@ -0,0 +1,51 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flogapp.accounts.models import UserDeviceToken
+from flogapp.services.models import NotificationOutbox
+from flogapp.services.notifications import FakeFCMSender, OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = ("Queue events for users that have device tokens and drain them through the fake FCM sender, "
+            "comparing one send per event with the batched dispatcher. Nothing is kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--events-per-user", type=int, default=3)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per FCM call.")
+
+    def handle(self, *args, **options):
+        tokens_by_user = {}
+        for user_id, token in UserDeviceToken.objects.values_list("user_id", "device_token"):
+            tokens_by_user.setdefault(user_id, []).append(token)
+        user_ids = random.sample(list(tokens_by_user), min(options["users"], len(tokens_by_user)))
+        if not user_ids:
+            self.stderr.write("No users with device tokens.")
+            return
+        events = [
+            (user_id, f"Service Status {index}", f"Update {index}")
+            for user_id in user_ids for index in range(options["events_per_user"])
+        ]
+
+        # one send per event to all of the user's tokens, as the per-transition tasks do
+        naive = FakeFCMSender()
+        for user_id, title, body in events:
+            naive.send_multicast(tokens_by_user[user_id], title, body)
+        self.stdout.write(f"per event  {len(events)} events -> {naive.calls} FCM calls, {naive.tokens} tokens, "
+                          f"~{naive.calls * options['latency']:.1f} s at {options['latency'] * 1000:.0f} ms/call")
+
+        with transaction.atomic():
+            for user_id, title, body in events:
+                NotificationOutbox.objects.enqueue([user_id], title, body)
+            sender = FakeFCMSender(latency=options["latency"])
+            started = time.perf_counter()
+            dispatched = OutboxDispatcher(sender, batch_size=options["batch_size"]).run()
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        self.stdout.write(f"dispatcher {dispatched} events -> {sender.calls} FCM calls, {sender.tokens} tokens, "
+                          f"{elapsed:.1f} s ({dispatched / elapsed:.0f} events/s)")
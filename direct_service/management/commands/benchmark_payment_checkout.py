@@ -0,0 +1,53 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.payments import MyFatoorahGateway
+from flogapp.services.stub_gateway import start_stub_gateway
+
+CHECKOUT_DATA = {
+    "customer_name": "Benchmark",
+    "mobile": "500000000",
+    "email": "benchmark@example.com",
+    "price": 100,
+    "callback_url": "http://localhost/service-request/payments",
+    "error_url": "http://localhost/service-request/payments",
+    "customer_reference": "benchmark",
+    "items": [{"item_name": "Benchmark", "item_quantity": 1, "item_price": 100, "tax_amount": 0}],
+}
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent checkouts against the local stub gateway, with a new HTTP session per checkout "
+            "and with the pooled gateway session.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkouts", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds per gateway call.")
+        parser.add_argument("--connect-latency", type=float, default=0.1, help="Stub seconds per new connection.")
+
+    def handle(self, *args, **options):
+        server = start_stub_gateway(latency=options["latency"], connect_latency=options["connect_latency"])
+        pooled = MyFatoorahGateway(base_url=server.url, pool_size=options["concurrency"])
+        runs = (
+            ("new session", lambda: MyFatoorahGateway(base_url=server.url)),
+            ("pooled", lambda: pooled),
+        )
+        for label, gateway in runs:
+            def checkout(_):
+                started = time.perf_counter()
+                gateway().checkout(CHECKOUT_DATA["price"], CHECKOUT_DATA)
+                return (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                timings = sorted(executor.map(checkout, range(options["checkouts"])))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label:<12} {options['checkouts'] / elapsed:7.1f} checkouts/s  "
+                f"p50 {statistics.median(timings):7.1f} ms  p95 {timings[int(len(timings) * 0.95) - 1]:7.1f} ms"
+            )
+        server.shutdown()
@@ -0,0 +1,44 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.payments import MyFatoorahGateway
+from flogapp.services.stub_gateway import start_stub_gateway
+
+
+class Command(BaseCommand):
+    help = ("Run concurrent invoice status lookups against the local stub gateway, with a new HTTP session per "
+            "lookup and with the pooled gateway session.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lookups", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--latency", type=float, default=0.05, help="Stub seconds per gateway call.")
+        parser.add_argument("--connect-latency", type=float, default=0.1, help="Stub seconds per new connection.")
+
+    def handle(self, *args, **options):
+        server = start_stub_gateway(latency=options["latency"], connect_latency=options["connect_latency"])
+        invoice_ids = [str(invoice_id) for invoice_id in range(options["lookups"])]
+        server.invoices.update(dict.fromkeys(invoice_ids, "Pending"))
+        pooled = MyFatoorahGateway(base_url=server.url, pool_size=options["concurrency"])
+        runs = (
+            ("new session", lambda: MyFatoorahGateway(base_url=server.url)),
+            ("pooled", lambda: pooled),
+        )
+        for label, gateway in runs:
+            def lookup(invoice_id):
+                started = time.perf_counter()
+                gateway().get_status(invoice_id)
+                return (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(options["concurrency"]) as executor:
+                timings = sorted(executor.map(lookup, invoice_ids))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{label:<12} {options['lookups'] / elapsed:7.1f} lookups/s  "
+                f"p50 {statistics.median(timings):7.1f} ms  p95 {timings[int(len(timings) * 0.95) - 1]:7.1f} ms"
+            )
+        server.shutdown()
@@ -0,0 +1,36 @@
+import decimal
+import time
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.choices import FieldTypeChoices
+from flogapp.services.models import ServiceField
+from flogapp.services.schema import FeatureSchema
+
+
+class Command(BaseCommand):
+    help = "Time price quotes against an in-memory pricing table; no database access."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        schema = FeatureSchema([
+            ServiceField(field_name="hours", field_type=FieldTypeChoices.INTEGER, is_price_unit_field=True,
+                         price_per_unit=decimal.Decimal("45.00")),
+            ServiceField(field_name="cleaners", field_type=FieldTypeChoices.INTEGER, is_price_unit_field=True,
+                         price_per_unit=decimal.Decimal("20.00")),
+            ServiceField(field_name="area", field_type=FieldTypeChoices.DECIMAL, is_price_unit_field=True,
+                         price_per_unit=decimal.Decimal("1.50"), is_required=False),
+            ServiceField(field_name="materials", field_type=FieldTypeChoices.BOOLEAN, is_price_unit_field=True,
+                         price_per_unit=decimal.Decimal("30.00")),
+            ServiceField(field_name="notes", field_type=FieldTypeChoices.TEXT),
+        ])
+        inputs = {"hours": "3", "cleaners": "2", "area": "120.5", "materials": "true", "notes": "ring twice"}
+        iterations = options["iterations"]
+        started = time.perf_counter()
+        for _ in range(iterations):
+            schema.quote(inputs)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"quote {schema.quote(inputs)}: {elapsed / iterations * 1e6:.1f} us per quote "
+                          f"({iterations / elapsed:.0f} quotes/sec)")
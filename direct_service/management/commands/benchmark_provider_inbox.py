@@ -0,0 +1,57 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from flogapp.services.choices import ServiceRequestStatusChoices
+from flogapp.services.models import ServiceProvider, ServiceProviderInbox, ServiceRequest
+
+
+def or_queryset(service_provider):
+    # the visibility filter ServiceRequestViewSet used before the inbox
+    return ServiceRequest.objects.filter(
+        Q(status=ServiceRequestStatusChoices.APPROVED, service_feature__service__in=service_provider.services.all())
+        | Q(assigned_service_provider=service_provider)
+        | Q(parent__assigned_service_provider=service_provider)
+        | Q(service_provider_rejected=service_provider)
+    ).filter(parent__isnull=True)
+
+
+def inbox_queryset(service_provider):
+    return ServiceRequest.objects.filter(provider_inbox__service_provider=service_provider, parent__isnull=True)
+
+
+class Command(BaseCommand):
+    help = ("Time provider listing, count and status filtering with the OR filter and with the inbox, "
+            "against the data in the configured database (load 1M requests / 5k providers to reproduce).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--providers", type=int, default=50)
+
+    def handle(self, *args, **options):
+        provider_ids = list(ServiceProvider.objects.values_list("id", flat=True))
+        providers = ServiceProvider.objects.filter(
+            id__in=random.sample(provider_ids, min(options["providers"], len(provider_ids)))
+        )
+        self.stdout.write(f"{ServiceRequest.objects.count()} requests, {len(provider_ids)} providers, "
+                          f"{ServiceProviderInbox.objects.count()} inbox rows")
+        for label, build in (("OR filter", or_queryset), ("inbox", inbox_queryset)):
+            timings = {"page": [], "count": [], "status": []}
+            for provider in providers:
+                qs = build(provider).order_by("-created")
+                timings["page"].append(self._time(lambda: list(qs.values_list("id", flat=True)[:20])))
+                timings["count"].append(self._time(qs.count))
+                timings["status"].append(self._time(
+                    qs.filter(status=ServiceRequestStatusChoices.ACCEPTED).count
+                ))
+            self.stdout.write(f"{label:<10} " + "  ".join(
+                f"{name} p50 {statistics.median(values):7.2f} ms" for name, values in timings.items()
+            ))
+
+    @staticmethod
+    def _time(run):
+        started = time.perf_counter()
+        run()
+        return (time.perf_counter() - started) * 1000
@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from flogapp.services.models import ServiceRequest
+from flogapp.services.pagination import KeysetPagination
+
+
+class Command(BaseCommand):
+    help = ("Time fetching deep pages of service requests by offset and by (created, id) keyset, "
+            "against the data in the configured database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 1000, 10000])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        limit = options["limit"]
+        qs = ServiceRequest.objects.order_by(*KeysetPagination.ordering)
+        total = qs.count()
+        self.stdout.write(f"{total} requests, {limit} per page")
+        for page in options["pages"]:
+            offset = (page - 1) * limit
+            if offset >= total:
+                break
+            offset_ms = self._time(lambda: list(qs.values_list("id", flat=True)[offset:offset + limit]), options["repeat"])
+            keyset_ms = 0.0
+            if offset:
+                # the row the previous page ended on, as the cursor would carry it
+                created, pk = qs.values_list("created", "id")[offset - 1]
+                keyset = qs.filter(Q(created__lt=created) | Q(id__lt=pk), created__lte=created)
+            else:
+                keyset = qs
+            keyset_ms = self._time(lambda: list(keyset.values_list("id", flat=True)[:limit]), options["repeat"])
+            self.stdout.write(f"page {page:>6}  offset {offset_ms:8.2f} ms  keyset {keyset_ms:6.2f} ms")
+
+    @staticmethod
+    def _time(run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,68 @@
+import copy
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.choices import ServiceRequestStatusChoices
+from flogapp.services.timeline import EXTRA_REQUEST_HISTORY_STEPS, WORK_HISTORY_STEPS, get_timeline
+
+WORK_HISTORY = [{"type": type, "title": title, "status": status, "done": False} for type, title, status in WORK_HISTORY_STEPS]
+EXTRA_REQUEST_HISTORY = [
+    {"type": type, "title": title, "status": status, "done": False} for type, title, status in EXTRA_REQUEST_HISTORY_STEPS
+]
+
+
+def deepcopy_timeline(ret):
+    # ServiceRequestSerializer._get_work_history before the precomputed timelines
+    extra_request_history = copy.deepcopy(EXTRA_REQUEST_HISTORY)
+    if not ret["parent"]:
+        work_history = copy.deepcopy(WORK_HISTORY)
+        index = next((index for (index, d) in enumerate(work_history) if d["status"] == ret["status"]), None)
+        history = []
+        if index is not None:
+            for wh in work_history[:index + 1]:
+                wh["done"] = True
+                history.append(wh)
+            history = history + work_history[index + 1:]
+        else:
+            history = work_history
+        extra_list = []
+        for e in ret["extra_request"]:
+            extra_list += e["request_history"]
+        return history[:-1] + extra_list + [history[-1]]
+    if ret["status"] in [ServiceRequestStatusChoices.INPROGRESS, ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER,
+                         ServiceRequestStatusChoices.COMPLETED]:
+        extra_request_history[0]["done"] = True
+        extra_request_history[1]["done"] = True
+    elif ret["status"] == ServiceRequestStatusChoices.ACCEPTED:
+        extra_request_history[0]["done"] = True
+    return extra_request_history
+
+
+def render_deepcopy(extras):
+    children = [{"parent": 1, "status": ServiceRequestStatusChoices.INPROGRESS, "extra_request": []} for _ in range(extras)]
+    for child in children:
+        child["request_history"] = deepcopy_timeline(child)
+    return deepcopy_timeline({"parent": None, "status": ServiceRequestStatusChoices.INPROGRESS, "extra_request": children})
+
+
+def render_precomputed(extras):
+    histories = [get_timeline(ServiceRequestStatusChoices.INPROGRESS, is_extra_request=True) for _ in range(extras)]
+    return get_timeline(ServiceRequestStatusChoices.INPROGRESS, extra_histories=histories)
+
+
+class Command(BaseCommand):
+    help = "Time rendering a request's work history, with its extra requests' histories, both ways."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for extras in (0, 10, 100):
+            assert render_deepcopy(extras) == render_precomputed(extras)
+            timings = []
+            for render in (render_deepcopy, render_precomputed):
+                seconds = min(timeit.repeat(lambda: render(extras), number=options["number"], repeat=3))
+                timings.append(seconds / options["number"] * 1e6)
+            self.stdout.write(f"{extras:>3} extra requests  deepcopy {timings[0]:8.1f} us  "
+                              f"precomputed {timings[1]:7.1f} us  ({timings[0] / timings[1]:.0f}x)")
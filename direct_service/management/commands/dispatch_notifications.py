@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from flogapp.services.notifications import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = "Send the pending push notifications in the outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        dispatched = OutboxDispatcher(batch_size=options["batch_size"]).run()
+        self.stdout.write(self.style.SUCCESS(f"Dispatched {dispatched} notifications."))
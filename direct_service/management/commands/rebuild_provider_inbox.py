@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flogapp.services.choices import ProviderInboxReasonChoices, ServiceRequestStatusChoices
+from flogapp.services.models import (
+    ServiceProviderInbox,
+    ServiceProviderRejectedService,
+    ServiceProviderService,
+    ServiceRequest
+)
+
+
+class Command(BaseCommand):
+    help = "Rebuild the provider inbox from assignments, rejections and approved requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        with transaction.atomic():
+            ServiceProviderInbox.objects.all().delete()
+            # most specific reason first: bulk_create(ignore_conflicts=True) keeps the first row per pair
+            self._insert(ProviderInboxReasonChoices.REJECTED, ServiceProviderRejectedService.objects.values_list(
+                "service_provider_id", "service_request_id", "service_request__status"
+            ))
+            self._insert(ProviderInboxReasonChoices.ASSIGNED, ServiceRequest.objects.filter(
+                assigned_service_provider__isnull=False
+            ).values_list("assigned_service_provider_id", "id", "status"))
+            self._insert(ProviderInboxReasonChoices.PARENT_ASSIGNED, ServiceRequest.objects.filter(
+                parent__assigned_service_provider__isnull=False
+            ).values_list("parent__assigned_service_provider_id", "id", "status"))
+            providers_by_service = {}
+            for service_id, provider_id in ServiceProviderService.objects.values_list("service_id", "service_provider_id"):
+                providers_by_service.setdefault(service_id, set()).add(provider_id)
+            approved = ServiceRequest.objects.filter(status=ServiceRequestStatusChoices.APPROVED).values_list(
+                "id", "service_feature__service_id"
+            )
+            self._insert(ProviderInboxReasonChoices.AVAILABLE, (
+                (provider_id, request_id, ServiceRequestStatusChoices.APPROVED)
+                for request_id, service_id in approved.iterator()
+                for provider_id in providers_by_service.get(service_id, ())
+            ))
+        self.stdout.write(self.style.SUCCESS(f"{ServiceProviderInbox.objects.count()} inbox rows."))
+
+    def _insert(self, reason, rows):
+        if hasattr(rows, "iterator"):
+            rows = rows.iterator()
+        batch = []
+        for provider_id, request_id, status in rows:
+            batch.append(ServiceProviderInbox(
+                service_provider_id=provider_id, service_request_id=request_id, reason=reason, status=status
+            ))
+            if len(batch) >= self.batch_size:
+                ServiceProviderInbox.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        ServiceProviderInbox.objects.bulk_create(batch, ignore_conflicts=True)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from flogapp.services.models import ServiceProvider, ServiceProviderTarget
+
+
+class Command(BaseCommand):
+    help = "Rebuild the new-job targeting rows from provider services, cities and device tokens."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ServiceProviderTarget.objects.all().delete()
+            for service_provider in ServiceProvider.objects.iterator():
+                ServiceProviderTarget.objects.refresh_provider(service_provider)
+        self.stdout.write(self.style.SUCCESS(f"{ServiceProviderTarget.objects.count()} targeting rows."))
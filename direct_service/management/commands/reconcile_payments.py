@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.payments import reconcile_pending_payments
+
+
+class Command(BaseCommand):
+    help = "Ask the payment gateway about stale pending invoices and settle the ones that were paid or failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than", type=int, default=30, help="Minutes since the payment was created.")
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        checked, settled = reconcile_pending_payments(
+            older_than=timedelta(minutes=options["older_than"]), batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} invoices, {settled} requests moved to pending."))
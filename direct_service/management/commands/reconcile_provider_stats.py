@@ -0,0 +1,86 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+from flogapp.services.choices import ServiceRequestStatusChoices
+from flogapp.services.models import (
+    ServiceProviderMonthlyStats,
+    ServiceProviderRejectedService,
+    ServiceProviderStats,
+    ServiceRequest
+)
+
+STAT_NAMES = ("accepted", "rejected", "completed", "earnings")
+
+
+class Command(BaseCommand):
+    help = "Recompute provider statistics from the requests and rewrite the rows that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the providers that drifted.")
+
+    def handle(self, *args, **options):
+        monthly = self._compute()
+        totals = defaultdict(lambda: dict.fromkeys(STAT_NAMES, 0))
+        for (provider_id, _), values in monthly.items():
+            for name in STAT_NAMES:
+                totals[provider_id][name] += values[name]
+
+        current = {
+            row["service_provider_id"]: row
+            for row in ServiceProviderStats.objects.values("service_provider_id", *STAT_NAMES)
+        }
+        drifted = [
+            provider_id for provider_id in set(totals) | set(current)
+            if any(
+                totals.get(provider_id, {}).get(name, 0) != current.get(provider_id, {}).get(name, 0)
+                for name in STAT_NAMES
+            )
+        ]
+        self.stdout.write(f"{len(drifted)} of {len(set(totals) | set(current))} providers drifted.")
+        if options["dry_run"] or not drifted:
+            return
+
+        with transaction.atomic():
+            ServiceProviderStats.objects.filter(service_provider_id__in=drifted).delete()
+            ServiceProviderMonthlyStats.objects.filter(service_provider_id__in=drifted).delete()
+            ServiceProviderStats.objects.bulk_create([
+                ServiceProviderStats(service_provider_id=provider_id, **totals[provider_id])
+                for provider_id in drifted if provider_id in totals
+            ])
+            ServiceProviderMonthlyStats.objects.bulk_create([
+                ServiceProviderMonthlyStats(service_provider_id=provider_id, month=month, **values)
+                for (provider_id, month), values in monthly.items() if provider_id in drifted
+            ])
+        self.stdout.write(self.style.SUCCESS(f"Rewrote statistics of {len(drifted)} providers."))
+
+    def _compute(self):
+        """``{(provider_id, month): {stat: value}}`` bucketed by the month each request was booked in."""
+        monthly = defaultdict(lambda: dict.fromkeys(STAT_NAMES, 0))
+        month = TruncMonth("created", output_field=DateField())
+        assigned = ServiceRequest.objects.filter(assigned_service_provider__isnull=False).annotate(month=month)
+        roots = assigned.filter(parent__isnull=True)
+        sources = (
+            ("accepted", roots.values("assigned_service_provider_id", "month").annotate(value=Count("id"))),
+            ("completed", roots.filter(status=ServiceRequestStatusChoices.COMPLETED).values(
+                "assigned_service_provider_id", "month"
+            ).annotate(value=Count("id"))),
+            ("earnings", assigned.values("assigned_service_provider_id", "month").annotate(value=Sum("price"))),
+        )
+        for name, rows in sources:
+            for row in rows.order_by():
+                monthly[(row["assigned_service_provider_id"], row["month"])][name] = row["value"] or 0
+        rejected = ServiceProviderRejectedService.objects.filter(
+            service_request__parent__isnull=True
+        ).annotate(
+            month=TruncMonth("service_request__created", output_field=DateField())
+        ).values("service_provider_id", "month").annotate(value=Count("id"))
+        for row in rejected.order_by():
+            monthly[(row["service_provider_id"], row["month"])]["rejected"] = row["value"]
+        for values in monthly.values():
+            values["earnings"] = Decimal(values["earnings"])
+        return monthly
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from flogapp.services.stub_gateway import start_stub_gateway
+
+
+class Command(BaseCommand):
+    help = ("Serve a local stand-in for the MyFatoorah endpoints the payment gateway uses. "
+            "Point the MyFatoorah base URL settings at it to exercise checkout and status lookups "
+            "without the real provider.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8901)
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every response.")
+        parser.add_argument("--connect-latency", type=float, default=0.1, help="Seconds added to every new connection.")
+
+    def handle(self, *args, **options):
+        server = start_stub_gateway(
+            options["host"], options["port"], options["latency"], options["connect_latency"]
+        )
+        self.stdout.write(f"Stub payment gateway on {server.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
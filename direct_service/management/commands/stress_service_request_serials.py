@@ -0,0 +1,50 @@
+import datetime
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from flogapp.services.models import SerialAllocator, ServiceRequestSerialCounter
+
+
+class Command(BaseCommand):
+    help = "Allocate service request serials from concurrent threads and check that none is handed out twice."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=50)
+        parser.add_argument("--per-thread", type=int, default=200)
+        parser.add_argument("--block-size", type=int, default=1)
+        parser.add_argument("--using", default="default")
+
+    def handle(self, *args, **options):
+        # a day no real request can have, removed again at the end
+        day = datetime.date(1970, 1, 1)
+        ServiceRequestSerialCounter.objects.using(options["using"]).filter(day=day).delete()
+        serials = []
+        serials_lock = threading.Lock()
+
+        def worker():
+            # one allocator per thread, like one per worker process
+            allocator = SerialAllocator(block_size=options["block_size"], using=options["using"])
+            allocated = [allocator.next(day) for _ in range(options["per_thread"])]
+            with serials_lock:
+                serials.extend(allocated)
+            connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        ServiceRequestSerialCounter.objects.using(options["using"]).filter(day=day).delete()
+
+        expected = options["threads"] * options["per_thread"]
+        if len(serials) != expected or len(set(serials)) != expected:
+            raise CommandError(f"{expected - len(set(serials))} duplicate or missing serials")
+        self.stdout.write(self.style.SUCCESS(
+            f"{expected} unique serials from {options['threads']} threads in {elapsed:.2f}s "
+            f"({elapsed / expected * 1e6:.0f} us each)"
+        ))
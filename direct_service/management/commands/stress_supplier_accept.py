@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from flogapp.services.choices import ServiceRequestStatusChoices
+from flogapp.services.models import ServiceProvider, ServiceRequest
+from flogapp.services.transitions import TransitionConflict, apply_transition
+
+
+class Command(BaseCommand):
+    help = ("Fire simultaneous supplier accepts at one request and check that exactly one wins. "
+            "The request is reopened for the run and put back as it was afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("request_id", type=int)
+        parser.add_argument("--accepts", type=int, default=100)
+
+    def handle(self, *args, **options):
+        original = ServiceRequest.objects.get(pk=options["request_id"])
+        if original.parent_id:
+            raise CommandError("Pick a request without a parent.")
+        provider_ids = list(ServiceProvider.objects.values_list("id", flat=True)[:options["accepts"]])
+        if not provider_ids:
+            raise CommandError("Needs at least one ServiceProvider.")
+        ServiceRequest.objects.filter(pk=original.pk).update(
+            status=ServiceRequestStatusChoices.APPROVED, assigned_service_provider=None
+        )
+        barrier = threading.Barrier(options["accepts"])
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def worker(index):
+            service_request = ServiceRequest(pk=original.pk, parent_id=None)
+            provider_id = provider_ids[index % len(provider_ids)]
+            barrier.wait()
+            try:
+                with transaction.atomic():
+                    apply_transition(service_request, "supplier_accept", assigned_service_provider_id=provider_id)
+                outcome = ("won", provider_id)
+            except TransitionConflict:
+                outcome = ("conflict", provider_id)
+            finally:
+                connections.close_all()
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(options["accepts"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        saved = ServiceRequest.objects.get(pk=original.pk)
+        ServiceRequest.objects.filter(pk=original.pk).update(
+            status=original.status, assigned_service_provider_id=original.assigned_service_provider_id
+        )
+        winners = [provider_id for outcome, provider_id in outcomes if outcome == "won"]
+        if len(winners) != 1 or saved.assigned_service_provider_id != winners[0]:
+            raise CommandError(f"{len(winners)} accepts won; request ended assigned to {saved.assigned_service_provider_id}")
+        self.stdout.write(self.style.SUCCESS(
+            f"1 of {len(outcomes)} simultaneous accepts won, {len(outcomes) - 1} got a conflict, in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,64 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .catalog import get_catalog_version
+
+
+class ConditionalGetMixin:
+    """
+    Answers list and retrieve with an ETag built from max(``updated``) and the row count of
+    get_validator_queryset(), computed before anything is serialized, and with 304 Not Modified
+    when the client's If-None-Match still matches. Retrieve also sends Last-Modified. The ETag
+    covers the user, the query string and the catalog version, since representations embed
+    catalog rows and vary by role.
+    """
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == "retrieve":
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset
+
+    def get_validators(self):
+        """``(etag, last_modified)``, or None when there is nothing to validate against."""
+        try:
+            validator = self.get_validator_queryset().order_by().aggregate(
+                last_modified=Max("updated"), count=Count("pk")
+            )
+        except (TypeError, ValueError, ValidationError):
+            return None
+        if self.action == "retrieve" and not validator["count"]:
+            return None
+        last_modified = validator["last_modified"]
+        signature = "|".join(str(part) for part in (
+            self.request.user.pk, self.request.get_full_path(), get_catalog_version(),
+            last_modified.isoformat() if last_modified else "", validator["count"]
+        ))
+        return f'"{hashlib.md5(signature.encode()).hexdigest()}"', last_modified
+
+    def conditional_response(self, request, respond):
+        validators = self.get_validators()
+        if validators is None:
+            return respond()
+        etag, last_modified = validators
+        # a list's max(updated) does not move when rows are deleted, so only retrieve is dated
+        last_modified = int(last_modified.timestamp()) if last_modified and self.action == "retrieve" else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified) or respond()
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
@@ -1,11 +1,19 @@
+import threading
+from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Substr
+from django.db.models.expressions import RawSQL
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django_mysql.models import ListCharField
 from autoslug import AutoSlugField
 from flogapp.core.bases.models import BaseModel, BaseStatusModel, BasePriceModel
 from flogapp.accounts.choices import RoleChoices, CurrentCityChoices
-from .choices import FieldTypeChoices, ServiceRequestStatusChoices, ServiceRequestRatingTypeChoices
+from .choices import (
+    FieldTypeChoices, ServiceRequestStatusChoices, ServiceRequestRatingTypeChoices, ProviderInboxReasonChoices
+)
 from .utils import upload_licence_path, upload_passport_path, upload_contract_info_path, upload_residance_photo_path
 
 
@@ -13,19 +21,77 @@ def custom_slugify(self):
     return self.upper()
 
 
+SERIAL_PREFIX = "FLGP"
+
+
 def get_request_id(self):
-    serial = 1
-    try:
-        request_object = ServiceRequest.objects.filter(created__date=timezone.now().date()).latest('created')
-        serial = int(request_object.serial[-4:]) + 1
-        print(serial)
-    except ServiceRequest.DoesNotExist:
-        pass
     return "{}-{}-{:04d}".format(
-        "FLGP", self.created.strftime("%Y%m%d"), serial
+        SERIAL_PREFIX, self.created.strftime("%Y%m%d"), serial_allocator.next(self.created.date())
     )
 
 
+class ServiceRequestSerialCounter(models.Model):
+    day = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def allocate(cls, day, count=1, using="default"):
+        """Reserve ``count`` consecutive serials for ``day`` under a row lock and return the first one."""
+        with transaction.atomic(using=using):
+            counter, _ = cls.objects.using(using).select_for_update().get_or_create(
+                day=day, defaults={"last_value": lambda: cls.issued_serials(day, using)}
+            )
+            cls.objects.using(using).filter(pk=counter.pk).update(last_value=F("last_value") + count)
+        return counter.last_value + 1
+
+    @staticmethod
+    def issued_serials(day, using="default"):
+        """
+        The highest serial already issued for ``day``, so a counter created on a day that has
+        requests (the day it is deployed) continues after them instead of starting over.
+        """
+        prefix = f"{SERIAL_PREFIX}-{day:%Y%m%d}-"
+        return ServiceRequest.objects.using(using).filter(serial__startswith=prefix).aggregate(
+            last=Max(Cast(Substr("serial", len(prefix) + 1), models.PositiveIntegerField()))
+        )["last"] or 0
+
+
+class SerialAllocator:
+    """
+    Hands out per-day serials from blocks of ``block_size`` reserved in ServiceRequestSerialCounter.
+
+    Point ``using`` at a database alias that is a second connection to the same database, so the
+    counter commits on its own and the row lock is not held for the whole booking transaction.
+    Blocks are only cached on such a connection: a block reserved inside the booking transaction
+    would be handed out again by another worker if that transaction rolled back.
+    """
+
+    def __init__(self, block_size=1, using="default"):
+        self.block_size = block_size
+        self.using = using
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = self._end = 0
+
+    def next(self, day):
+        if self.block_size == 1 or transaction.get_connection(self.using).in_atomic_block:
+            return ServiceRequestSerialCounter.allocate(day, 1, self.using)
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                self._day = day
+                self._next = ServiceRequestSerialCounter.allocate(day, self.block_size, self.using)
+                self._end = self._next + self.block_size
+            serial = self._next
+            self._next += 1
+            return serial
+
+
+serial_allocator = SerialAllocator(
+    block_size=getattr(settings, "SERVICE_REQUEST_SERIAL_BLOCK_SIZE", 1),
+    using=getattr(settings, "SERVICE_REQUEST_SERIAL_DATABASE", "default"),
+)
+
+
 class Service(BaseModel):
     name = models.CharField(max_length=200)
     parent = models.ForeignKey('self', null=True, on_delete=models.CASCADE, related_name="sub_services")
@@ -33,6 +99,11 @@ class Service(BaseModel):
     description = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created", "id"]),
+        ]
+
 
 class Feature(BaseModel):
     service = models.ForeignKey(Service, on_delete=models.DO_NOTHING)
@@ -46,6 +117,11 @@ class Feature(BaseModel):
         max_length=1000
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created", "id"]),
+        ]
+
 
 class ServiceField(BaseModel):
     service_feature = models.ForeignKey(Feature, on_delete=models.DO_NOTHING, related_name="service_fields")
@@ -78,6 +154,11 @@ class ServiceProvider(BaseModel):
         max_length=1000
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["created", "id"]),
+        ]
+
 
 class ServiceProviderEmployee(BaseModel):
     service_provider = models.ForeignKey(ServiceProvider, on_delete=models.DO_NOTHING,
@@ -85,6 +166,11 @@ class ServiceProviderEmployee(BaseModel):
     employee = models.ForeignKey("accounts.User", on_delete=models.DO_NOTHING, related_name="service_provider_employee")
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["service_provider", "created", "id"]),
+        ]
+
 
 class ServiceProviderService(BaseModel):
     service = models.ForeignKey(Service, on_delete=models.DO_NOTHING)
@@ -93,6 +179,83 @@ class ServiceProviderService(BaseModel):
     is_active = models.BooleanField(default=True)
 
 
+class ServiceRequestManager(models.Manager):
+
+    def tree_ids(self, *root_ids):
+        """
+        The ``root_ids`` and the ids of every extra request below them, as a recursive CTE to filter ``id__in`` on.
+        A single queryset may be passed instead of ids; its rows seed the tree inside the same query.
+        """
+        table = self.model._meta.db_table
+        parent_column = self.model._meta.get_field("parent").column
+        if len(root_ids) == 1 and isinstance(root_ids[0], models.QuerySet):
+            roots, params = root_ids[0].order_by().values("pk").query.sql_with_params()
+        else:
+            roots, params = ", ".join(["%s"] * len(root_ids)), root_ids
+        return RawSQL(
+            f"WITH RECURSIVE tree (id) AS ("
+            f"SELECT id FROM {table} WHERE id IN ({roots}) "
+            f"UNION ALL SELECT child.id FROM {table} child JOIN tree ON child.{parent_column} = tree.id"
+            f") SELECT id FROM tree",
+            list(params)
+        )
+
+    def touch(self, ids):
+        """Bump ``updated`` on requests whose representation changed through a related row."""
+        self.filter(id__in=ids).update(updated=timezone.now())
+
+    def discard(self, service_request):
+        """Delete a request whose checkout failed, with the values and attachments that do not cascade."""
+        service_request.values.all().delete()
+        service_request.attachments.all().delete()
+        service_request.delete()
+
+    def get_tree(self, root_id, queryset=None):
+        """
+        The request ``root_id`` with every extra request below it, fetched in one query and linked
+        as attach_trees does. Relations to load on every node go on ``queryset``.
+        """
+        queryset = self.all() if queryset is None else queryset
+        nodes = list(queryset.filter(id__in=self.tree_ids(root_id)).order_by("created"))
+        root = next((node for node in nodes if node.id == root_id), None)
+        if root is None:
+            raise self.model.DoesNotExist
+        self._link(nodes)
+        return root
+
+    def attach_trees(self, roots, queryset=None):
+        """
+        Load every extra request below ``roots`` at any depth in one query through a recursive CTE on
+        ``parent``. Each node's ``extra_service_request.all()`` is then served from memory, oldest
+        first, so serializing the trees needs no per-node queries. Relations to load on every extra
+        request go on ``queryset``.
+        """
+        roots = list(roots)
+        if not roots:
+            return roots
+        root_ids = [root.id for root in roots]
+        queryset = self.all() if queryset is None else queryset
+        descendants = queryset.filter(id__in=self.tree_ids(*root_ids)).exclude(id__in=root_ids).order_by("created")
+        self._link(roots + list(descendants))
+        return roots
+
+    def _link(self, nodes):
+        children = {node.id: [] for node in nodes}
+        for node in nodes:
+            if node.parent_id in children:
+                children[node.parent_id].append(node)
+        parent_field = self.model._meta.get_field("parent")
+        for node in nodes:
+            for child in children[node.id]:
+                parent_field.set_cached_value(child, node)
+            cached = self.filter(parent=node)
+            cached._result_cache = children[node.id]
+            cached._prefetch_done = True
+            node._prefetched_objects_cache = {
+                **getattr(node, "_prefetched_objects_cache", {}), "extra_service_request": cached
+            }
+
+
 class ServiceRequest(BasePriceModel):
     serial = AutoSlugField(
         populate_from=get_request_id, null=True, db_index=True, slugify=custom_slugify
@@ -115,6 +278,14 @@ class ServiceRequest(BasePriceModel):
     assign = models.ManyToManyField("accounts.User", blank=True)
     parent = models.ForeignKey('self', null=True, on_delete=models.CASCADE, related_name="extra_service_request")
 
+    objects = ServiceRequestManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created", "id"]),
+            models.Index(fields=["requester", "created", "id"]),
+        ]
+
 
 class ServiceProviderRejectedService(BaseModel):
     service_request = models.ForeignKey(ServiceRequest, related_name="suppliers_rejected", on_delete=models.DO_NOTHING)
@@ -122,6 +293,241 @@ class ServiceProviderRejectedService(BaseModel):
     rejection_reason = models.TextField(null=True)
 
 
+class ServiceProviderInboxManager(models.Manager):
+
+    def open_to_providers(self, service_request):
+        """An approved request becomes visible to every provider of its service."""
+        provider_ids = ServiceProviderService.objects.filter(
+            service_id=service_request.service_feature.service_id
+        ).values_list("service_provider_id", flat=True).distinct()
+        self.bulk_create([
+            self.model(
+                service_provider_id=provider_id,
+                service_request=service_request,
+                reason=ProviderInboxReasonChoices.AVAILABLE,
+                status=service_request.status
+            )
+            for provider_id in provider_ids
+        ], ignore_conflicts=True, batch_size=1000)
+        self.refresh_status([service_request.id])
+
+    def close_to_providers(self, service_request):
+        """A request that left ``approved`` is no longer offered to the providers who did not act on it."""
+        self.filter(service_request=service_request, reason=ProviderInboxReasonChoices.AVAILABLE).delete()
+
+    def set_reason(self, service_request, service_provider, reason):
+        self.update_or_create(
+            service_request=service_request,
+            service_provider=service_provider,
+            defaults={"reason": reason, "status": service_request.status}
+        )
+
+    def assign(self, service_request, service_provider):
+        self.close_to_providers(service_request)
+        self.set_reason(service_request, service_provider, ProviderInboxReasonChoices.ASSIGNED)
+        for child in service_request.extra_service_request.all():
+            self.set_reason(child, service_provider, ProviderInboxReasonChoices.PARENT_ASSIGNED)
+
+    def unassign(self, service_request, service_provider):
+        self.filter(
+            service_request__parent=service_request,
+            service_provider=service_provider,
+            reason=ProviderInboxReasonChoices.PARENT_ASSIGNED
+        ).delete()
+
+    def refresh_provider(self, service_provider):
+        """Re-derive the approved requests a provider is offered after its services changed."""
+        self.filter(service_provider=service_provider, reason=ProviderInboxReasonChoices.AVAILABLE).delete()
+        approved = ServiceRequest.objects.filter(
+            status=ServiceRequestStatusChoices.APPROVED,
+            service_feature__service__in=service_provider.services.all()
+        ).values_list("id", flat=True)
+        self.bulk_create([
+            self.model(
+                service_provider=service_provider,
+                service_request_id=request_id,
+                reason=ProviderInboxReasonChoices.AVAILABLE,
+                status=ServiceRequestStatusChoices.APPROVED
+            )
+            for request_id in approved.iterator()
+        ], ignore_conflicts=True, batch_size=1000)
+
+    def refresh_status(self, service_request_ids):
+        self.filter(service_request_id__in=service_request_ids).update(status=Subquery(
+            ServiceRequest.objects.filter(pk=OuterRef("service_request_id")).values("status")[:1]
+        ))
+
+
+class ServiceProviderInbox(BaseModel):
+    """
+    The requests a provider can see, one row per (provider, request), with the request status
+    copied in so provider listings, counts and status filters read a single index.
+    """
+    service_provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE, related_name="inbox")
+    service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, related_name="provider_inbox")
+    reason = models.CharField(max_length=25, choices=ProviderInboxReasonChoices.choices)
+    status = models.CharField(max_length=25, choices=ServiceRequestStatusChoices.choices)
+
+    objects = ServiceProviderInboxManager()
+
+    class Meta:
+        unique_together = ("service_provider", "service_request")
+        indexes = [
+            models.Index(fields=["service_provider", "status", "reason"]),
+        ]
+
+
+class ServiceProviderTargetManager(models.Manager):
+
+    def refresh_provider(self, service_provider):
+        """Rewrite the provider's rows from its active services, its cities and its user's device tokens."""
+        from flogapp.accounts.models import UserDeviceToken
+
+        self.filter(service_provider=service_provider).delete()
+        service_ids = ServiceProviderService.objects.filter(
+            service_provider=service_provider, is_active=True
+        ).values_list("service_id", flat=True)
+        tokens = set(UserDeviceToken.objects.filter(user_id=service_provider.user_id).values_list(
+            "device_token", flat=True
+        ))
+        self.bulk_create([
+            self.model(service_provider=service_provider, service_id=service_id, city=city, device_token=token)
+            for service_id in service_ids for city in set(service_provider.cities or []) for token in tokens
+        ], ignore_conflicts=True, batch_size=1000)
+
+    def iter_token_pages(self, service_id, cities, page_size=500):
+        """
+        Distinct device tokens of the providers offering ``service_id`` in any of ``cities``, streamed
+        in pages of at most ``page_size`` by keyset on the primary key.
+        """
+        qs = self.filter(service_id=service_id, city__in=cities).order_by("id")
+        seen = set()
+        last_id = 0
+        while True:
+            rows = list(qs.filter(id__gt=last_id).values_list("id", "device_token")[:page_size])
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            page = [token for _, token in rows if token not in seen]
+            seen.update(page)
+            if page:
+                yield page
+
+
+class ServiceProviderTarget(BaseModel):
+    """
+    Who to alert about new jobs: one row per (service, city, device token) a provider serves,
+    so a job fans out through one index range instead of every provider token.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name="+")
+    city = models.CharField(max_length=50, choices=CurrentCityChoices.choices)
+    service_provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE, related_name="targets")
+    device_token = models.CharField(max_length=255)
+
+    objects = ServiceProviderTargetManager()
+
+    class Meta:
+        unique_together = ("service", "city", "device_token")
+        indexes = [
+            models.Index(fields=["service", "city", "id"]),
+        ]
+
+
+class ServiceProviderStatsManager(models.Manager):
+
+    def record(self, service_provider_id, service_request, accepted=0, rejected=0, completed=0, earnings=0):
+        """
+        Add the deltas to the provider's totals and to the bucket of the month the request was booked in.
+        Call inside the transaction that makes the status change.
+        """
+        month = timezone.localdate(service_request.created).replace(day=1)
+        deltas = {"accepted": accepted, "rejected": rejected, "completed": completed, "earnings": earnings}
+        updates = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if not updates:
+            return
+        for manager, lookup in (
+                (self, {"service_provider_id": service_provider_id}),
+                (ServiceProviderMonthlyStats.objects, {"service_provider_id": service_provider_id, "month": month})
+        ):
+            if not manager.filter(**lookup).update(**updates):
+                # first record for this row; a concurrent first record that inserts it too is ignored
+                manager.bulk_create([manager.model(**lookup)], ignore_conflicts=True)
+                manager.filter(**lookup).update(**updates)
+
+
+class ServiceProviderStatsBase(BaseModel):
+    accepted = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    earnings = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ServiceProviderStats(ServiceProviderStatsBase):
+    """
+    Running totals per provider: root requests accepted (currently assigned), rejected and completed,
+    and the gross price of every request assigned to it. Reconciled by reconcile_provider_stats.
+    """
+    service_provider = models.OneToOneField(ServiceProvider, on_delete=models.CASCADE, related_name="stats")
+
+    objects = ServiceProviderStatsManager()
+
+
+class ServiceProviderMonthlyStats(ServiceProviderStatsBase):
+    service_provider = models.ForeignKey(ServiceProvider, on_delete=models.CASCADE, related_name="monthly_stats")
+    month = models.DateField()
+
+    class Meta:
+        unique_together = ("service_provider", "month")
+
+
+class NotificationOutboxManager(models.Manager):
+
+    def enqueue(self, user_ids, title, body, service_request=None):
+        """Queue one push per user; call inside the transaction that makes the change being announced."""
+        return self.bulk_create([
+            self.model(user_id=user_id, service_request=service_request, title=title, body=body)
+            for user_id in set(user_ids) if user_id
+        ])
+
+    def pending(self):
+        """Rows not yet dispatched and not held by a dispatcher; a claim older than CLAIM_TIMEOUT is taken as abandoned."""
+        return self.filter(
+            Q(claimed_at__isnull=True) | Q(claimed_at__lt=timezone.now() - self.model.CLAIM_TIMEOUT),
+            dispatched_at__isnull=True
+        ).order_by("id")
+
+    def claim(self, batch_size):
+        """Take up to ``batch_size`` pending rows; the row locks last only as long as this claim."""
+        with transaction.atomic():
+            events = list(self.pending().select_for_update(skip_locked=True)[:batch_size])
+            self.filter(id__in=[event.id for event in events]).update(claimed_at=timezone.now())
+        return events
+
+
+class NotificationOutbox(BaseModel):
+    """Push notifications waiting for the dispatcher in direct_service.notifications."""
+    user = models.ForeignKey("accounts.User", on_delete=models.CASCADE, related_name="+")
+    service_request = models.ForeignKey(ServiceRequest, on_delete=models.CASCADE, null=True, blank=True,
+                                        related_name="+")
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+
+    # a dispatcher that dies between claiming and sending releases its rows after this long
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+
+    objects = NotificationOutboxManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["dispatched_at", "id"]),
+        ]
+
+
 class ServiceRequestAttachments(BaseModel):
     service_request = models.ForeignKey(ServiceRequest, related_name="attachments", on_delete=models.DO_NOTHING)
     attachment = models.FileField(upload_to='direct_service/attachments')
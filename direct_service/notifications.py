@@ -0,0 +1,195 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from flogapp.accounts.models import UserDeviceToken
+from .models import NotificationOutbox, ServiceProviderTarget
+
+# FCM accepts at most 500 registration tokens per multicast message
+MULTICAST_LIMIT = 500
+
+# the push texts for both the outbox and the tasks in direct_service.tasks
+MESSAGES = {
+    "request_approved": (
+        "Service Status ⌛ FlogApp Admin Approved ⌛",
+        "Your Needed Service “{feature}“ is approved by the FlogApp Admin team 👍"
+    ),
+    "request_rejected": (
+        "Service Status ⌛ FlogApp Rejected service ⌛",
+        "Your Needed Service “{feature}“ is rejected, please contact us at info@flogapp.com"
+    ),
+    "request_accepted": (
+        "Service Status ⌛ Aceepted ⌛",
+        "Your Needed Service “{feature}“ is aceepted by service provider."
+    ),
+    "request_extra_hours_approved": (
+        "Extra Service Requested Status 🌟Approved 🌟",
+        "Your extra service requested has been approved "
+    ),
+    "request_extra_hours_rejected": (
+        "Extra Service Requested Status ⌛ Rejected  ⌛",
+        "Your extra service has been rejected - please contact Info@flogapp.com"
+    ),
+    "request_started": (
+        "Your job status 🌟  Started  🌟",
+        "Your Job has been started -Make sure to keep your cient Happy & Satisfied 🎯🤩"
+    ),
+    "request_assigned": (
+        "New Job assigned “{description}“",
+        "A new job has been assigned under your name - Make sure to be on time and do the needed service."
+    ),
+    "service_request_completed": (
+        "“{feature}“ status 👍 Completed 👍",
+        "“{feature}“ has been completed successfully 👍"
+    ),
+    "new_service_request": (
+        "New Job is waiting for you 👀 {description} 👀",
+        "Check it out now 🏃‍♂️ & Accept the new job for  better reputation 💼👍 & Extra Income 💰"
+    ),
+    "request_completed_by_client": (
+        "”{requester}” Extra Service status 💰 Paid successfully 💰",
+        "“{description}“ has been completed successfully 👍"
+    ),
+}
+
+
+class _RequestContext(dict):
+    """Resolves only the placeholders a message uses, so unused relations are never loaded."""
+    resolvers = {
+        "feature": lambda service_request: service_request.service_feature.name,
+        "description": lambda service_request: service_request.description,
+        "requester": lambda service_request: service_request.requester.name,
+    }
+
+    def __init__(self, service_request):
+        super().__init__()
+        self.service_request = service_request
+
+    def __missing__(self, key):
+        return self.resolvers[key](self.service_request)
+
+
+def render_message(event, context):
+    """The ``event`` title and body with their placeholders filled from the ``context`` mapping."""
+    title, body = MESSAGES[event]
+    return title.format_map(context), body.format_map(context)
+
+
+def notify(event, service_request, user_ids):
+    """Write the ``event`` push for ``user_ids`` to the outbox, in the caller's transaction."""
+    title, body = render_message(event, _RequestContext(service_request))
+    return NotificationOutbox.objects.enqueue(user_ids, title, body, service_request=service_request)
+
+
+class PushSender:
+    """Sends through the existing bulk notification task, run inline by the dispatcher."""
+
+    def send_multicast(self, tokens, title, body):
+        from flogapp.notifications.tasks import send_bulk_notification
+        send_bulk_notification(title, body, tokens)
+
+
+class FakeFCMSender:
+    """Records sends instead of calling FCM; ``latency`` seconds are slept per multicast call."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.tokens = 0
+
+    def send_multicast(self, tokens, title, body):
+        if len(tokens) > MULTICAST_LIMIT:
+            raise ValueError(f"Multicast of {len(tokens)} tokens exceeds the FCM limit of {MULTICAST_LIMIT}.")
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls += 1
+        self.tokens += len(tokens)
+
+
+def get_sender():
+    """``settings.NOTIFICATION_SENDER`` (dotted path) if set, otherwise PushSender."""
+    sender_path = getattr(settings, "NOTIFICATION_SENDER", None)
+    return import_string(sender_path)() if sender_path else PushSender()
+
+
+class OutboxDispatcher:
+    """
+    Drains the outbox in batches. Within a batch every user gets one push (their events coalesced),
+    users receiving the same text share multicast calls, and each device token is sent to once.
+    """
+
+    def __init__(self, sender=None, batch_size=1000, multicast_limit=MULTICAST_LIMIT):
+        self.sender = sender or get_sender()
+        self.batch_size = batch_size
+        self.multicast_limit = multicast_limit
+
+    def run(self):
+        """Dispatch until the outbox is empty; returns the number of events handled."""
+        total = 0
+        while True:
+            dispatched = self.dispatch_batch()
+            if not dispatched:
+                return total
+            total += dispatched
+
+    def dispatch_batch(self):
+        # rows are claimed in a short transaction and sent outside it, so no lock is held while FCM
+        # is called; each message's rows are marked once its sends succeed, and the rows of a
+        # failed send are retried once their claim expires
+        events = NotificationOutbox.objects.claim(self.batch_size)
+        if not events:
+            return 0
+        messages = self.coalesce(events)
+        users_by_message = defaultdict(set)
+        for user_id, message in messages.items():
+            users_by_message[message].add(user_id)
+        tokens_by_message = defaultdict(set)
+        for user_id, token in UserDeviceToken.objects.filter(
+                user_id__in=messages.keys()
+        ).values_list("user_id", "device_token"):
+            tokens_by_message[messages[user_id]].add(token)
+        event_ids_by_user = defaultdict(list)
+        for event in events:
+            event_ids_by_user[event.user_id].append(event.id)
+        for message, user_ids in users_by_message.items():
+            title, body = message
+            tokens = sorted(tokens_by_message.get(message, ()))
+            for start in range(0, len(tokens), self.multicast_limit):
+                self.sender.send_multicast(tokens[start:start + self.multicast_limit], title, body)
+            NotificationOutbox.objects.filter(
+                id__in=[event_id for user_id in user_ids for event_id in event_ids_by_user[user_id]]
+            ).update(dispatched_at=timezone.now())
+        return len(events)
+
+    @staticmethod
+    def coalesce(events):
+        """``{user_id: (title, body)}``: the latest event, noting how many earlier ones it stands for."""
+        by_user = defaultdict(list)
+        for event in events:
+            by_user[event.user_id].append(event)
+        messages = {}
+        for user_id, user_events in by_user.items():
+            latest = user_events[-1]
+            body = latest.body
+            if len(user_events) > 1:
+                body = f"{body} (+{len(user_events) - 1} more updates)"
+            messages[user_id] = (latest.title, body)
+        return messages
+
+
+def fan_out_new_job(service_request, sender=None, page_size=MULTICAST_LIMIT):
+    """
+    Alert the providers offering the job's service in the cities its feature is offered in, one
+    multicast per page of targeting rows. Returns the number of tokens sent to.
+    """
+    sender = sender or get_sender()
+    title, body = render_message("new_service_request", _RequestContext(service_request))
+    feature = service_request.service_feature
+    sent = 0
+    for tokens in ServiceProviderTarget.objects.iter_token_pages(feature.service_id, feature.cities or [], page_size):
+        sender.send_multicast(tokens, title, body)
+        sent += len(tokens)
+    return sent
@@ -0,0 +1,72 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from flogapp.core.bases.pagination import LimitPagination
+
+
+class KeysetPagination(LimitPagination):
+    """
+    Newest first pages that continue from the last row's (created, id) instead of an offset, so
+    every page costs the same. ``?count=false`` skips the total count. Requests that still send
+    ``offset`` are paginated by LimitPagination as before.
+    """
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    fallback_limit = 20
+    ordering = ("-created", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = not request.query_params.get(self.offset_query_param)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request) or self.fallback_limit
+        queryset = queryset.order_by(*self.ordering)
+        self.count = None
+        if request.query_params.get(self.count_query_param, "").lower() not in ("false", "0"):
+            self.count = queryset.count()
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            created, pk = self.decode_cursor(cursor)
+            # the created__lte bound lets the (created, id) index range-scan; the OR alone defeats it
+            queryset = queryset.filter(Q(created__lt=created) | Q(id__lt=pk), created__lte=created)
+        rows = list(queryset[:self.limit + 1])
+        self.next_cursor = self.encode_cursor(rows[self.limit - 1]) if len(rows) > self.limit else None
+        return rows[:self.limit]
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count is not None:
+            response["count"] = self.count
+        response["next"] = self.get_next_link()
+        response["previous"] = None
+        response["results"] = data
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    @staticmethod
+    def encode_cursor(row):
+        return base64.urlsafe_b64encode(f"{row.created.isoformat()}|{row.id}".encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            created, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(created), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor.")
@@ -0,0 +1,198 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+
+from flogapp.payments.choices import PaymentStatusChoices
+from flogapp.payments.models import ServiceRequestPayment
+from .choices import ServiceRequestStatusChoices
+from .models import ServiceRequest
+
+PAID = "Paid"
+# MyFatoorah invoice statuses after which the invoice can no longer be paid
+FAILED_STATUSES = ("Failed", "Expired", "Canceled")
+
+
+class PaymentGatewayError(Exception):
+    pass
+
+
+class BasePaymentGateway:
+    """
+    Talks to the payment provider. Calls block on the network, so views make them outside any
+    database transaction.
+    """
+
+    def checkout(self, amount, data):
+        """Create an invoice for ``amount``; returns ``{"invoice_id", "payment_id", "payment_url"}``."""
+        raise NotImplementedError
+
+    def get_status(self, key, key_type="InvoiceId"):
+        """``(invoice_id, status)`` for an invoice or payment id; status is e.g. ``"Paid"``, ``"Pending"`` or ``"Failed"``."""
+        raise NotImplementedError
+
+    def get_statuses(self, invoice_ids, max_workers=10):
+        """``{invoice_id: status}`` looked up concurrently; invoices the gateway could not answer for are left out."""
+        def lookup(invoice_id):
+            try:
+                return self.get_status(invoice_id)
+            except PaymentGatewayError:
+                return None
+
+        with ThreadPoolExecutor(max_workers) as executor:
+            return dict(result for result in executor.map(lookup, invoice_ids) if result)
+
+
+class MyFatoorahGateway(BasePaymentGateway):
+    """
+    MyFatoorah v2 API over one pooled keep-alive session with connect and read timeouts. Connection
+    failures are retried for every call; timeouts, dropped responses and 5xx only for the calls that
+    create nothing (InitiatePayment, GetPaymentStatus), so ExecutePayment never makes two invoices.
+    Invoices are in ``settings.MYFATOORAH_CURRENCY`` (AED, the currency of the UAE numbers checkout
+    takes, if unset) and paid with ``settings.MYFATOORAH_PAYMENT_METHOD_ID``, or the first method
+    InitiatePayment offers.
+    """
+
+    def __init__(self, base_url=None, api_key=None, timeout=(3.05, 15), retries=2, backoff=0.3, pool_size=20):
+        self.base_url = (base_url or settings.MYFATOORAH_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key or getattr(settings, 'MYFATOORAH_API_KEY', '')}",
+            "Content-Type": "application/json",
+        })
+        # no adapter retries: _post is the only retry layer
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def checkout(self, amount, data):
+        methods = self._post("/v2/InitiatePayment", {
+            "InvoiceAmount": float(amount), "CurrencyIso": getattr(settings, "MYFATOORAH_CURRENCY", "AED")
+        })
+        method_id = getattr(settings, "MYFATOORAH_PAYMENT_METHOD_ID", None) or methods["PaymentMethods"][0]["PaymentMethodId"]
+        invoice = self._post("/v2/ExecutePayment", {
+            "PaymentMethodId": method_id,
+            "CustomerName": data["customer_name"],
+            "CustomerMobile": data["mobile"],
+            "CustomerEmail": data["email"],
+            "InvoiceValue": float(data["price"]),
+            "CallBackUrl": data["callback_url"],
+            "ErrorUrl": data["error_url"],
+            "CustomerReference": data["customer_reference"],
+            "InvoiceItems": [
+                {"ItemName": item["item_name"], "Quantity": item["item_quantity"], "UnitPrice": float(item["item_price"])}
+                for item in data["items"]
+            ],
+        }, retry_reads=False)
+        return {
+            "invoice_id": str(invoice["InvoiceId"]),
+            "payment_id": (invoice.get("InvoiceTransactions") or [{}])[0].get("PaymentId"),
+            "payment_url": invoice["PaymentURL"],
+        }
+
+    def get_status(self, key, key_type="InvoiceId"):
+        data = self._post("/v2/GetPaymentStatus", {"Key": str(key), "KeyType": key_type})
+        return str(data["InvoiceId"]), data["InvoiceStatus"]
+
+    def _post(self, path, payload, retry_reads=True):
+        attempts = 1 + self.retries
+        for attempt in range(attempts):
+            try:
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+                if response.status_code >= 500 and attempt + 1 < attempts:
+                    raise requests.HTTPError(f"{response.status_code} from {path}")
+                body = response.json()
+            except (requests.RequestException, ValueError) as err:
+                if attempt + 1 == attempts or not (retry_reads or _is_connect_failure(err)):
+                    raise PaymentGatewayError(f"{path} failed: {err}") from err
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if not body.get("IsSuccess"):
+                raise PaymentGatewayError(body.get("Message") or f"{path} was not successful")
+            return body["Data"]
+
+
+def _is_connect_failure(err):
+    """True when ``err`` came from opening the connection, so the gateway never saw the request."""
+    reason = getattr(err.args[0], "reason", None) if err.args else None
+    # urllib3's NewConnectionError (refused, unreachable) is a ConnectTimeoutError too
+    return isinstance(err, requests.ConnectionError) and isinstance(reason, ConnectTimeoutError)
+
+
+_gateway = None
+
+
+def get_payment_gateway():
+    """``settings.PAYMENT_GATEWAY`` (dotted path) if set, otherwise MyFatoorahGateway; one per process."""
+    global _gateway
+    if _gateway is None:
+        gateway_path = getattr(settings, "PAYMENT_GATEWAY", None)
+        _gateway = import_string(gateway_path)() if gateway_path else MyFatoorahGateway()
+    return _gateway
+
+
+def settle_invoices(statuses):
+    """
+    Apply gateway statuses ``{invoice_id: status}`` to pending payments. Paid invoices move their
+    payment to complete and their request from payment-pending to pending with conditional UPDATEs,
+    so repeated or concurrent deliveries change and notify nothing twice. Failed, expired and canceled
+    invoices move their payment to failed. Returns the requests moved to pending.
+    """
+    from .counts import invalidate_request_counts
+    from .tasks import enqueue_on_commit, extra_hours_service_request_payment_success, pending_for_approval
+
+    paid = [invoice_id for invoice_id, invoice_status in statuses.items() if invoice_status == PAID]
+    failed = [invoice_id for invoice_id, invoice_status in statuses.items() if invoice_status in FAILED_STATUSES]
+    with transaction.atomic():
+        payments = ServiceRequestPayment.objects.filter(invoice_id__in=paid, status=PaymentStatusChoices.PENDING)
+        request_ids = list(payments.select_for_update().values_list("service_request_id", flat=True))
+        settled = []
+        if request_ids:
+            payments.update(status=PaymentStatusChoices.COMPLETE)
+            ServiceRequest.objects.touch(request_ids)
+            waiting = ServiceRequest.objects.filter(
+                id__in=request_ids, status=ServiceRequestStatusChoices.PAYMENT_PENDING
+            )
+            settled = list(waiting.select_for_update())
+            waiting.update(status=ServiceRequestStatusChoices.PENDING)
+            invalidate_request_counts(request_ids)
+            for service_request in settled:
+                enqueue_on_commit(pending_for_approval, service_request)
+            for extra_request in ServiceRequest.objects.filter(id__in=request_ids, parent__isnull=False):
+                enqueue_on_commit(extra_hours_service_request_payment_success, extra_request)
+        if failed:
+            ServiceRequestPayment.objects.filter(invoice_id__in=failed, status=PaymentStatusChoices.PENDING).update(
+                status=PaymentStatusChoices.FAILED
+            )
+    return settled
+
+
+def reconcile_pending_payments(gateway=None, older_than=timedelta(minutes=30), batch_size=100):
+    """
+    Settle the payments whose callback never came: pending invoices older than ``older_than`` are
+    looked up ``batch_size`` at a time. Returns ``(checked, settled)``.
+    """
+    gateway = gateway or get_payment_gateway()
+    stale = ServiceRequestPayment.objects.filter(
+        status=PaymentStatusChoices.PENDING, invoice_id__isnull=False, created__lt=timezone.now() - older_than
+    ).order_by("id")
+    checked = settled = 0
+    last_id = 0
+    while True:
+        batch = list(stale.filter(id__gt=last_id).values_list("id", "invoice_id")[:batch_size])
+        if not batch:
+            return checked, settled
+        last_id = batch[-1][0]
+        statuses = gateway.get_statuses([invoice_id for _, invoice_id in batch])
+        checked += len(batch)
+        settled += len(settle_invoices(statuses))
@@ -0,0 +1,80 @@
+import decimal
+import uuid
+from django.core.cache import cache
+from rest_framework.exceptions import ValidationError
+
+from .choices import FieldTypeChoices, FieldTypeChoicesFieldMap
+from .models import ServiceField
+
+VERSION_KEY = "service_feature_schema:{}"
+
+
+class FeatureSchema:
+    """The ServiceFields of one Feature, loaded once and shared by every request for that feature."""
+
+    def __init__(self, service_fields):
+        self.fields = {field.field_name: field for field in service_fields}
+        self.price_fields = {name: field for name, field in self.fields.items() if field.is_price_unit_field}
+
+    def get_price(self, values):
+        """Price of already validated ``values``; a missing optional price field counts as zero."""
+        price = decimal.Decimal(0)
+        for field_name, service_field in self.price_fields.items():
+            value = values.get(field_name)
+            if not value:
+                continue
+            if service_field.field_type == FieldTypeChoices.BOOLEAN:
+                price += service_field.price_per_unit
+            else:
+                price += service_field.price_per_unit * decimal.Decimal(value)
+        return price
+
+    def quote(self, data):
+        """
+        Validate only the price-unit inputs of ``data`` with the field map templates and price them,
+        skipping the full ServiceRequestSerializer.
+        """
+        values = {}
+        errors = {}
+        for field_name, service_field in self.price_fields.items():
+            if data.get(field_name) in (None, ""):
+                if service_field.is_required:
+                    errors[field_name] = ["This field is required."]
+                continue
+            try:
+                values[field_name] = FieldTypeChoicesFieldMap[service_field.field_type].to_internal_value(data[field_name])
+            except ValidationError as err:
+                errors[field_name] = err.detail
+        if errors:
+            raise ValidationError(errors)
+        return self.get_price(values)
+
+    def build_fields(self, price_only=False):
+        """Fresh, unbound serializer fields; built from the field map templates' arguments instead of deep copies."""
+        fields = {}
+        for field_name, service_field in (self.price_fields if price_only else self.fields).items():
+            template = FieldTypeChoicesFieldMap[service_field.field_type]
+            kwargs = dict(template._kwargs, required=service_field.is_required, write_only=True)
+            field = template.__class__(*template._args, **kwargs)
+            if service_field.field_type in [FieldTypeChoices.FILE, FieldTypeChoices.IMAGE]:
+                field.use_url = True
+            fields[field_name] = field
+        return fields
+
+
+_schemas = {}
+
+
+def get_feature_schema(feature_id):
+    # the version lives in the shared cache so a change made by one worker reaches all of them; a
+    # random token rather than a counter, so an evicted key never comes back as a version still held
+    version = cache.get_or_set(VERSION_KEY.format(feature_id), uuid.uuid4().hex, timeout=None)
+    cached = _schemas.get(feature_id)
+    if cached is None or cached[0] != version:
+        cached = (version, FeatureSchema(ServiceField.objects.filter(service_feature_id=feature_id)))
+        _schemas[feature_id] = cached
+    return cached[1]
+
+
+def invalidate_feature_schema(feature_id):
+    cache.set(VERSION_KEY.format(feature_id), uuid.uuid4().hex, timeout=None)
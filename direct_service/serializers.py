@@ -1,6 +1,6 @@
 import json
-import copy
 from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -24,10 +24,17 @@ from .models import (
     ServiceRequestValues,
     ServiceRequestRating,
     ServiceRequestAttachments,
-    ServiceProviderRejectedService
+    ServiceProviderRejectedService,
+    ServiceProviderInbox,
+    ServiceProviderStats,
+    ServiceProviderTarget
 )
 from flogapp.accounts.serializers import UserSerializer, UserCreateSerializer, AddressSerializer
-from .choices import FieldTypeChoices, FieldTypeChoicesFieldMap, ServiceRequestRatingTypeChoices, ServiceRequestStatusChoices
+from .choices import FieldTypeChoices, ServiceRequestRatingTypeChoices, ServiceRequestStatusChoices
+from .catalog import get_context_catalog
+from .counts import invalidate_user_counts
+from .timeline import get_timeline
+from .schema import get_feature_schema, invalidate_feature_schema
 from .tasks import *
 
 class ServiceSerializer(serializers.ModelSerializer):
@@ -35,7 +42,7 @@ class ServiceSerializer(serializers.ModelSerializer):
     has_child_services = serializers.SerializerMethodField()
 
     def get_has_child_services(self, obj):
-        return obj.sub_services.exists()
+        return obj.id in get_context_catalog(self.context).parent_ids
     
     class Meta:
         model = Service
@@ -72,6 +79,10 @@ class ServiceFields(serializers.Field):
         return ser.validated_data
     
     def to_representation(self, obj):
+        request = self.context.get("request")
+        if request is not None and request.method in SAFE_METHODS:
+            return get_context_catalog(self.context).service_fields.get(obj.instance.id, [])
+        # a write's response must show the fields it just saved, before the catalog moves on
         return ServiceFieldSerializer(obj.all(), many=True).data
 
 class ServiceFeatureSerializer(serializers.ModelSerializer):
@@ -100,6 +111,7 @@ class ServiceFeatureSerializer(serializers.ModelSerializer):
         for service_field in service_fields:
             service_fields_objs.append(ServiceField(service_feature=instance, **service_field))
         ServiceField.objects.bulk_create(service_fields_objs)
+        transaction.on_commit(lambda: invalidate_feature_schema(instance.id))
         return instance
 
     @transaction.atomic
@@ -120,6 +132,7 @@ class ServiceFeatureSerializer(serializers.ModelSerializer):
                 service_fields_objs_to_create.append(ServiceField(service_feature=instance, **service_field))
         ServiceField.objects.bulk_create(service_fields_objs_to_create)
         ServiceField.objects.bulk_update(service_fields_objs_to_update, ["label", "is_active"])
+        transaction.on_commit(lambda: invalidate_feature_schema(instance.id))
         return instance
     
 class ServiceProviderSerializer(serializers.ModelSerializer):
@@ -189,6 +202,9 @@ class ServiceProviderSerializer(serializers.ModelSerializer):
         for service in services:
             objs.append(ServiceProviderService(service=service, service_provider=instance, price_per_unit=0))
         ServiceProviderService.objects.bulk_create(objs)
+        ServiceProviderInbox.objects.refresh_provider(instance)
+        ServiceProviderTarget.objects.refresh_provider(instance)
+        invalidate_user_counts([instance.user_id])
         return instance
     
     @transaction.atomic
@@ -204,20 +220,19 @@ class ServiceProviderSerializer(serializers.ModelSerializer):
         for service in services:
             ServiceProviderService.objects.update_or_create(service=service, service_provider=instance, defaults={"price_per_unit":0})
         ServiceProviderService.objects.exclude(service__in=services).delete()
+        ServiceProviderInbox.objects.refresh_provider(instance)
+        ServiceProviderTarget.objects.refresh_provider(instance)
+        invalidate_user_counts([instance.user_id])
         return instance
 
     def to_representation(self, obj):
         ret = super(ServiceProviderSerializer, self).to_representation(obj)
         print(self.context["view"].action)
         if self.context.get("view") and self.context["view"].action=="retrieve":
-            ret["request_accepted"] = ServiceRequest.objects.filter(
-                assigned_service_provider=obj,
-                parent__isnull=True
-            ).count()
-            ret["request_rejected"] =  ServiceRequest.objects.filter(
-                service_provider_rejected=obj,
-                parent__isnull=True
-            ).count()
+            stats = ServiceProviderStats.objects.filter(service_provider=obj).first()
+            ret["request_accepted"] = stats.accepted if stats else 0
+            ret["request_rejected"] = stats.rejected if stats else 0
+            ret["request_completed"] = stats.completed if stats else 0
         return ret
     
 class ServiceProviderEmployeeSerializer(serializers.ModelSerializer):
@@ -252,63 +267,75 @@ class ServiceRequestAddressField(serializers.Field):
         return AddressSerializer(obj).data
 
 class ServiceRequestSerializer(serializers.ModelSerializer):
-    work_history = [
-        {
-            "type": "payment-successfull",
-            "title": "Payment done",
-            "status": ServiceRequestStatusChoices.PENDING,
-            "done": False
-        },
-        {
-            "type": "approved",
-            "title":"Service Request Approved",
-            "status": ServiceRequestStatusChoices.APPROVED,
-            "done": False
-        },
-        {
-            "type": "accepted",
-            "title":"Supplier Accepted",
-            "status": ServiceRequestStatusChoices.ACCEPTED,
-            "done": False
-        },
-        {
-            "type": "inprogress",
-            "title":"Service Request in progress",
-            "status": ServiceRequestStatusChoices.INPROGRESS,
-            "done": False
-        },
-        {
-            "type": "completed-by-provider",
-            "title":"Service Request Completed By Service Provider",
-            "status": ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER,
-            "done": False
-        },
-        {
-            "type": "completed",
-            "title":"Service Request Completed",
-            "status": ServiceRequestStatusChoices.COMPLETED,
-            "done": False
-        }
-    ]
-    extra_request_history = [
-        {
-            "type": "pending",
-            "title":"Supplier Accepted",
-            "status": ServiceRequestStatusChoices.PENDING,
-            "done": False
-        },
-        {
-            "type": "payment-done",
-            "title":"Extra Service Request Payment Done",
-            "status": ServiceRequestStatusChoices.INPROGRESS,
-            "done": False
-        }
-    ]
+    @staticmethod
+    def _eager_relations():
+        related = [
+            "assigned_service_provider", "requester", "address", "service_feature"
+        ]
+        # service_feature's service_fields come from the catalog snapshot
+        prefetched = [
+            "assign",
+            "attachments",
+            "service_provider_rejected",
+            Prefetch("suppliers_rejected", queryset=ServiceProviderRejectedService.objects.select_related("service_provider")),
+            Prefetch("values", queryset=ServiceRequestValues.objects.select_related("service_field")),
+        ]
+        return related, prefetched
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """Load every relation to_representation touches; load_trees adds the extra requests once the page is known."""
+        related, prefetched = cls._eager_relations()
+        return queryset.select_related(*related).prefetch_related(*prefetched)
+
+    @classmethod
+    def load_trees(cls, roots):
+        """Attach every extra request below ``roots``, at any depth, with the same relations loaded."""
+        related, prefetched = cls._eager_relations()
+        return ServiceRequest.objects.attach_trees(
+            roots, ServiceRequest.objects.select_related(*related).prefetch_related(*prefetched)
+        )
+
+    @classmethod
+    def load_tree(cls, root_id, context):
+        """
+        A request and every extra request below it, with the relations and completed payments
+        to_representation touches loaded once for the whole tree.
+        """
+        related, prefetched = cls._eager_relations()
+        root = ServiceRequest.objects.get_tree(
+            root_id, ServiceRequest.objects.select_related(*related).prefetch_related(*prefetched)
+        )
+        nodes, index = [root], 0
+        while index < len(nodes):
+            nodes.extend(nodes[index].extra_service_request.all())
+            index += 1
+        payments = context.setdefault("completed_payments", {})
+        payments.update({node.id: [] for node in nodes})
+        for payment in ServiceRequestPayment.objects.filter(
+                status=PaymentStatusChoices.COMPLETE, service_request_id__in=[node.id for node in nodes]
+        ):
+            payments[payment.service_request_id].append(payment)
+        return root
+
     def get_extra_request(self, obj):
         qs = obj.extra_service_request.all()
         if self.context["request"].user.role==RoleChoices.SERVICE_PROVIDER_EMPLOYEE:
-            qs = qs.filter(status=ServiceRequestStatusChoices.INPROGRESS)
+            # filtered in memory so the prefetched children are reused
+            qs = [child for child in qs if child.status==ServiceRequestStatusChoices.INPROGRESS]
         return ServiceRequestSerializer(qs, many=True, context=self.context).data
+
+    def _get_completed_payments(self, obj):
+        # one query for a request and its prefetched extra requests, shared through the context
+        payments = self.context.setdefault("completed_payments", {})
+        if obj.id not in payments:
+            ids = [obj.id] + [child.id for child in obj.extra_service_request.all()]
+            payments.update({request_id: [] for request_id in ids})
+            for payment in ServiceRequestPayment.objects.filter(
+                    status=PaymentStatusChoices.COMPLETE, service_request_id__in=ids
+            ):
+                payments[payment.service_request_id].append(payment)
+        return payments[obj.id]
     
     def __init__(self, *args, **kwargs):
         is_get_price_view = kwargs["context"]["view"].action in ["service_request_price", "extra_service_request"]
@@ -332,24 +359,15 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
             self.fields["address"] = ServiceRequestAddressField(required=not is_get_price_view)
             if kwargs["context"]["request"].method.lower()=='post' and kwargs["context"].get("service_feature"):
                 service_feature = kwargs["context"]["service_feature"]
-                self.extra_fields = {}
-                from copy import deepcopy
-                fields_qs = service_feature.service_fields.all()
-                if is_get_price_view:
-                    fields_qs = fields_qs.filter(is_price_unit_field=True)
+                schema = get_feature_schema(service_feature.id)
+                self.extra_fields = schema.price_fields if is_get_price_view else schema.fields
                 self.fields["attachments"] = serializers.ListField(
                     child=serializers.FileField(
                         max_length=100000,
                         allow_empty_file=False
                     ), write_only=True,required=False
                 )
-                for service_field in fields_qs:
-                    self.extra_fields[service_field.field_name] = service_field
-                    self.fields[service_field.field_name] = deepcopy(FieldTypeChoicesFieldMap[service_field.field_type])
-                    self.fields[service_field.field_name].required = service_field.is_required
-                    if service_field.field_type in [FieldTypeChoices.FILE, FieldTypeChoices.IMAGE]:
-                        self.fields[service_field.field_name].use_url = True
-                    self.fields[service_field.field_name].write_only = True
+                self.fields.update(schema.build_fields(price_only=is_get_price_view))
             else:
                 self.fields["values"] = ServiceRequestValuesSerializer(many=True)
                 self.fields["attachments"] = ServiceRequestAttachmentsSerializer(many=True, context=kwargs["context"])
@@ -397,32 +415,10 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
         return instance
     
     def _get_work_history(self, ret):
-        history = []
-        extra_request_history = copy.deepcopy(self.extra_request_history)
-        if not ret["parent"]:
-            work_history = copy.deepcopy(self.work_history)
-            index = next((index for (index, d) in enumerate(work_history) if d["status"] == ret["status"]), None)
-            if index is not None:
-                for wh in work_history[:index+1]:
-                    wh["done"] = True
-                    history.append(wh)
-                history = history + work_history[index+1:]
-            else:
-                history = work_history
-            if index and ret['status']==ServiceRequestStatusChoices.COMPLETED:
-                history[-1]["done"] = True
-            extra_list = []
-            for e in ret["extra_request"]:
-                extra_list+=e["request_history"]
-            history = history[:-1] + extra_list + [history[-1]]
-        else:
-            if ret["status"] in [ServiceRequestStatusChoices.INPROGRESS, ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER, ServiceRequestStatusChoices.COMPLETED]:
-                extra_request_history[0]["done"] = True
-                extra_request_history[1]["done"] = True
-            elif ret["status"]==ServiceRequestStatusChoices.ACCEPTED:
-                extra_request_history[0]["done"] = True
-            history = extra_request_history
-        return history
+        return get_timeline(
+            ret["status"], is_extra_request=bool(ret["parent"]),
+            extra_histories=[extra["request_history"] for extra in ret["extra_request"]]
+        )
             
     def to_representation(self, obj):
         ret = super(ServiceRequestSerializer, self).to_representation(obj)
@@ -443,9 +439,7 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
             ret["payments"] = [{
                 "id": payment.id,
                 "price": payment.price
-            }for payment in ServiceRequestPayment.objects.filter(status=PaymentStatusChoices.COMPLETE).filter(
-                service_request=obj
-            )]
+            }for payment in self._get_completed_payments(obj)]
         ret["requester"] = {
             "id":obj.requester.id,
             "name": obj.requester.name,
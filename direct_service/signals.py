@@ -0,0 +1,47 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+
+from flogapp.accounts.models import UserDeviceToken
+from .catalog import invalidate_catalog
+from .counts import invalidate_request_counts
+from .models import Feature, Service, ServiceField, ServiceProvider, ServiceProviderTarget, ServiceRequest
+
+
+def device_token_changed(sender, instance, **kwargs):
+    service_provider = ServiceProvider.objects.filter(user_id=instance.user_id).first()
+    if service_provider:
+        ServiceProviderTarget.objects.refresh_provider(service_provider)
+
+
+def service_request_changed(sender, instance, **kwargs):
+    invalidate_request_counts([instance.id])
+
+
+def service_request_assign_changed(sender, instance, action, reverse, pk_set=None, **kwargs):
+    # removed employees are no longer found on the request, so they are passed along; a clear is
+    # caught before it happens, while the employees still are
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if reverse:
+        # changed from the employee's side: instance is the user, pk_set the requests
+        request_ids = pk_set if pk_set is not None else instance.servicerequest_set.values_list("id", flat=True)
+        invalidate_request_counts(request_ids, user_ids=[instance.id])
+    else:
+        invalidate_request_counts([instance.id], user_ids=pk_set or ())
+
+
+def catalog_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+def connect_signals():
+    post_save.connect(device_token_changed, sender=UserDeviceToken, dispatch_uid="provider_target_token_saved")
+    post_delete.connect(device_token_changed, sender=UserDeviceToken, dispatch_uid="provider_target_token_deleted")
+    post_save.connect(service_request_changed, sender=ServiceRequest, dispatch_uid="request_count_saved")
+    # before the delete, while the request and its inbox rows still say who could see it
+    pre_delete.connect(service_request_changed, sender=ServiceRequest, dispatch_uid="request_count_deleted")
+    m2m_changed.connect(
+        service_request_assign_changed, sender=ServiceRequest.assign.through, dispatch_uid="request_count_assign"
+    )
+    for model in (Service, Feature, ServiceField):
+        post_save.connect(catalog_changed, sender=model, dispatch_uid=f"catalog_{model.__name__}_saved")
+        post_delete.connect(catalog_changed, sender=model, dispatch_uid=f"catalog_{model.__name__}_deleted")
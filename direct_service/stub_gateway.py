@@ -0,0 +1,77 @@
+"""
+A local stand-in for MyFatoorah, for development and benchmarks only; nothing in the app imports it.
+"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    """
+    Answers the MyFatoorah endpoints MyFatoorahGateway uses after ``server.latency`` seconds, and
+    stalls each new connection ``server.connect_latency`` seconds to stand in for the TLS handshake.
+    Invoices start Pending; POST /stub/pay with {"InvoiceId"} marks one Paid.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.server.connect_latency)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        time.sleep(self.server.latency)
+        invoices = self.server.invoices
+        if self.path == "/v2/InitiatePayment":
+            data = {"PaymentMethods": [{"PaymentMethodId": 2, "PaymentMethodEn": "Stub"}]}
+        elif self.path == "/v2/ExecutePayment":
+            invoice_id = str(next(self.server.invoice_ids))
+            payment_id = uuid.uuid4().hex
+            invoices[invoice_id] = "Pending"
+            self.server.payment_invoices[payment_id] = invoice_id
+            data = {
+                "InvoiceId": invoice_id,
+                "PaymentURL": f"http://{self.server.server_address[0]}:{self.server.server_address[1]}/pay/{invoice_id}",
+                "InvoiceTransactions": [{"PaymentId": payment_id}],
+            }
+        elif self.path == "/v2/GetPaymentStatus":
+            invoice_id = str(payload["Key"])
+            if payload.get("KeyType") == "PaymentId":
+                invoice_id = self.server.payment_invoices.get(invoice_id)
+            if invoice_id not in invoices:
+                return self._reply(200, {"IsSuccess": False, "Message": "Invoice not found"})
+            data = {"InvoiceId": invoice_id, "InvoiceStatus": invoices[invoice_id]}
+        elif self.path == "/stub/pay":
+            invoices[str(payload["InvoiceId"])] = "Paid"
+            data = {}
+        else:
+            return self._reply(404, {"IsSuccess": False, "Message": "Not found"})
+        self._reply(200, {"IsSuccess": True, "Message": "", "Data": data})
+
+    def _reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_gateway(host="127.0.0.1", port=0, latency=0.0, connect_latency=0.0):
+    """Serve StubGatewayHandler from a daemon thread; returns the server (``server.url`` is its base URL)."""
+    server = ThreadingHTTPServer((host, port), StubGatewayHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.connect_latency = connect_latency
+    server.invoices = {}
+    server.payment_invoices = {}
+    server.invoice_ids = itertools.count(100000)
+    server.url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
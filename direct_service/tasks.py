@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+from django.db import transaction
 from django.utils import timezone
+from types import SimpleNamespace
 from celery.schedules import crontab
 from flogapp.taskapp.celery import app
 from flogapp.utils import get_html_from_template
@@ -9,148 +11,207 @@ from flogapp.fcm import FCMNotificationV1
 from flogapp.accounts.models import User, UserDeviceToken
 from flogapp.services.models import ServiceRequest 
 from flogapp.notifications.tasks import send_user_notification, send_bulk_notification
+from flogapp.services.notifications import render_message
+
+SNAPSHOT_RESOLVERS = {
+    "requester_id": lambda obj: obj.requester_id,
+    "requester_name": lambda obj: obj.requester.name,
+    "description": lambda obj: obj.description,
+    "feature_name": lambda obj: obj.service_feature.name,
+    # None and [] when the request has no provider or parent, so snapshots never fail on optional relations
+    "provider_user_id": lambda obj: obj.assigned_service_provider.user_id if obj.assigned_service_provider_id else None,
+    "assign_ids": lambda obj: list(obj.assign.values_list("id", flat=True)),
+    "parent_assign_ids": lambda obj: list(obj.parent.assign.values_list("id", flat=True)) if obj.parent_id else [],
+}
+
+# the request fields each task's message needs
+SNAPSHOT_FIELDS = {
+    "pending_for_approval": ("requester_id", "description"),
+    "request_approved": ("requester_id", "feature_name"),
+    "request_rejected": ("requester_id", "feature_name"),
+    "request_accepted": ("requester_id", "feature_name"),
+    "request_started": ("assign_ids",),
+    "request_completed_by_maid": ("requester_id",),
+    "extra_hours_service_request": ("requester_name", "provider_user_id"),
+    "request_extra_hours_approved": ("requester_id",),
+    "request_extra_hours_rejected": ("requester_id",),
+    "new_service_request": (),
+    "request_completed_by_client": ("requester_name", "description", "provider_user_id"),
+    "request_completed_by_client_demo": ("requester_name", "feature_name", "provider_user_id"),
+    "request_assigned": ("description",),
+    "extra_service_request": ("requester_name", "description", "provider_user_id"),
+    "extra_service_request_payment_done": ("requester_name", "parent_assign_ids"),
+    "extra_hours_service_request_payment_success": ("requester_name", "provider_user_id", "parent_assign_ids"),
+    "service_request_completed": ("requester_id", "feature_name"),
+}
+
+
+def take_snapshot(service_request, fields):
+    return {field: SNAPSHOT_RESOLVERS[field](service_request) for field in fields}
+
+
+def _load(task_name, service_id, snapshot):
+    """The task's message fields from ``snapshot``, reloading the request only for callers that sent none."""
+    if snapshot is None:
+        snapshot = take_snapshot(ServiceRequest.objects.get(pk=service_id), SNAPSHOT_FIELDS[task_name])
+    return SimpleNamespace(id=service_id, **snapshot)
+
+
+def enqueue_on_commit(task, service_request, *args):
+    """
+    Queue ``task`` for ``service_request`` once the current transaction commits, with a snapshot of
+    the fields its message needs so the worker neither reloads the row nor sees it uncommitted.
+    """
+    snapshot = take_snapshot(service_request, SNAPSHOT_FIELDS[task.name.rsplit(".", 1)[-1]])
+    service_id = service_request.id
+    transaction.on_commit(lambda: task.delay(service_id, *args, snapshot=snapshot))
+
 
 @app.task
-def pending_for_approval(service_id):
-    obj = ServiceRequest.objects.get(service_id)
+def pending_for_approval(service_id, snapshot=None):
+    obj = _load("pending_for_approval", service_id, snapshot)
     title = "Service Status ⌛ Under Approval ⌛"
     body = f'Your needed Service “{obj.description}“ under approval'
     send_user_notification(obj.requester_id, title, body)
     
 @app.task
-def request_approved(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Service Status ⌛ FlogApp Admin Approved ⌛"
-    body = f'Your Needed Service “{obj.service_feature.name}“ is approved by the FlogApp Admin team 👍'
+def request_approved(service_id, snapshot=None):
+    obj = _load("request_approved", service_id, snapshot)
+    title, body = render_message("request_approved", {"feature": obj.feature_name})
     send_user_notification(obj.requester_id, title, body)
     
 @app.task
-def request_rejected(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Service Status ⌛ FlogApp Rejected service ⌛"
-    body = f'Your Needed Service "{service.service_feature.name}“ is rejected, please contact us at info@flogapp.com'
+def request_rejected(service_id, snapshot=None):
+    obj = _load("request_rejected", service_id, snapshot)
+    title, body = render_message("request_rejected", {"feature": obj.feature_name})
     send_user_notification(obj.requester_id, title, body)
 
     
 @app.task
-def request_accepted(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Service Status ⌛ Aceepted ⌛"
-    body = f'Your Needed Service “{obj.service_feature.name}“ is aceepted by service provider.'
+def request_accepted(service_id, snapshot=None):
+    obj = _load("request_accepted", service_id, snapshot)
+    title, body = render_message("request_accepted", {"feature": obj.feature_name})
     send_user_notification(obj.requester_id, title, body)
 
 @app.task
-def request_assigned(service_id):
-    #TODO  -  Have to discuss
-    return 
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = '{obj.description} assigned person'
-    body = f'Your Needed Service “ Service Name “ is assigned to “Assigned person name”'
-    send_user_notification(obj.requester_id, title, body)
-
-@app.task
-def request_started(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Your job status 🌟  Started  🌟"
-    body = f'Your Job has been started -Make sure to keep your cient Happy & Satisfied 🎯🤩'
-    tokens = UserDeviceToken.objects.filter(user__in=obj.assign.all())
+def request_started(service_id, snapshot=None):
+    obj = _load("request_started", service_id, snapshot)
+    title, body = render_message("request_started", {})
+    tokens = UserDeviceToken.objects.filter(user_id__in=obj.assign_ids)
     if tokens:
         send_bulk_notification(title, body, tokens)
 
 
 @app.task
-def request_completed_by_maid(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
+def request_completed_by_maid(service_id, snapshot=None):
+    obj = _load("request_completed_by_maid", service_id, snapshot)
     title = "Your Service Status 👍 Completed 👍"
     body = f'Your Service has been completed - Make sure to Review & Rate your completed service 🔏'
     send_user_notification(obj.requester_id, title, body)
 
 @app.task
-def extra_hours_service_request(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'“{obj.requester.name}” asking for extra service ⌛⏰'
+def extra_hours_service_request(service_id, snapshot=None):
+    obj = _load("extra_hours_service_request", service_id, snapshot)
+    title = f'“{obj.requester_name}” asking for extra service ⌛⏰'
     body = f'Please check your portal and accept your client extra service for client satisfaction 💼👍'
-    send_user_notification(obj.assigned_service_provider.user_id, title, body)
+    if obj.provider_user_id:
+        send_user_notification(obj.provider_user_id, title, body)
  
 @app.task
-def request_extra_hours_approved(service_id):
+def request_extra_hours_approved(service_id, snapshot=None):
     #TODO - To be discuss
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Extra Service Requested Status 🌟Approved 🌟"
-    body = f'Your extra service requested has been approved '
+    obj = _load("request_extra_hours_approved", service_id, snapshot)
+    title, body = render_message("request_extra_hours_approved", {})
     send_user_notification(obj.requester_id, title, body)
 
 @app.task
-def request_extra_hours_rejected(service_id):
+def request_extra_hours_rejected(service_id, snapshot=None):
     #TODO - To be discuss
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = "Extra Service Requested Status ⌛ Rejected  ⌛"
-    body = f'Your extra service has been rejected - please contact Info@flogapp.com'
+    obj = _load("request_extra_hours_rejected", service_id, snapshot)
+    title, body = render_message("request_extra_hours_rejected", {})
     send_user_notification(obj.requester_id, title, body)
 
 @app.task
-def new_service_request(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f"New Job is waiting for you 👀 {obj.description} 👀"
-    body = f'Check it out now 🏃‍♂️ & Accept the new job for  better reputation 💼👍 & Extra Income 💰'
-    tokens = UserDeviceToken.objects.values_list('device_token', flat=True).filter(user__service_provider__isnull=False)
-    send_bulk_notification(title, body, tokens)
+def new_service_request(service_id, snapshot=None):
+    # the fan-out needs the feature's service and cities, which the targeting query reads anyway
+    from flogapp.services.notifications import fan_out_new_job
+    return fan_out_new_job(ServiceRequest.objects.select_related("service_feature").get(pk=service_id))
 
 @app.task
-def request_completed_by_client(service_id):
+def request_completed_by_client(service_id, snapshot=None):
     #TODO - To be discuss
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'”{obj.requester.name}” Extra Service status 💰 Paid successfully 💰'
-    body = f'“{obj.description}“ has been completed successfully 👍'
-    send_user_notification(obj.assigned_service_provider.user_id, title, body)
+    obj = _load("request_completed_by_client", service_id, snapshot)
+    title, body = render_message("request_completed_by_client", {"requester": obj.requester_name, "description": obj.description})
+    if obj.provider_user_id:
+        send_user_notification(obj.provider_user_id, title, body)
 
 @app.task
-def request_completed_by_client_demo(service_id):
+def request_completed_by_client_demo(service_id, snapshot=None):
     #TODO - To be discuss
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'”{obj.requester.name}” Extra Service status 💰 Paid successfully 💰'
-    body = f'“{obj.service_feature.name}“ has been completed successfully 👍'
-    send_user_notification(obj.assigned_service_provider.user_id, title, body)
+    obj = _load("request_completed_by_client_demo", service_id, snapshot)
+    title = f'”{obj.requester_name}” Extra Service status 💰 Paid successfully 💰'
+    body = f'“{obj.feature_name}“ has been completed successfully 👍'
+    if obj.provider_user_id:
+        send_user_notification(obj.provider_user_id, title, body)
     
 @app.task
-def request_assigned(service_id, assign_ids):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'New Job assigned “{obj.description}“'
-    body = f'A new job has been assigned under your name - Make sure to be on time and do the needed service.'
+def request_assigned(service_id, assign_ids, snapshot=None):
+    obj = _load("request_assigned", service_id, snapshot)
+    title, body = render_message("request_assigned", {"description": obj.description})
     tokens = UserDeviceToken.objects.filter(user_id__in=assign_ids)
     if tokens:
         send_bulk_notification(title, body, tokens)
 
 @app.task
-def extra_service_request(service_id):
+def extra_service_request(service_id, snapshot=None):
     #TODO DUplicate
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'“{obj.requester.name}“ Requested Extra Service'
+    obj = _load("extra_service_request", service_id, snapshot)
+    title = f'“{obj.requester_name}“ Requested Extra Service'
     body = f'Please Accept the extra service for “{obj.description}“ so the client will do the needed payment'
-    send_user_notification(obj.assigned_service_provider.user_id, title, body)
+    if obj.provider_user_id:
+        send_user_notification(obj.provider_user_id, title, body)
 
 
 @app.task
-def extra_service_request_payment_done(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'”{obj.requester.name}” Extra Service status 💰 Paid successfully 💰'
-    body = f'“{obj.requester.name}“  has been done the needed payment for the extra service job - make sure to increase his satisfaction & do the needed job  👍'
-    tokens = UserDeviceToken.objects.filter(user__in=obj.parent.assign.all())
+def extra_service_request_payment_done(service_id, snapshot=None):
+    obj = _load("extra_service_request_payment_done", service_id, snapshot)
+    title = f'”{obj.requester_name}” Extra Service status 💰 Paid successfully 💰'
+    body = f'“{obj.requester_name}“  has been done the needed payment for the extra service job - make sure to increase his satisfaction & do the needed job  👍'
+    tokens = UserDeviceToken.objects.filter(user_id__in=obj.parent_assign_ids)
     if tokens:
         send_bulk_notification(title, body, tokens)
         
 @app.task
-def extra_hours_service_request_payment_success(service_id):
+def extra_hours_service_request_payment_success(service_id, snapshot=None):
     #TODO - Duplicate
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'“{obj.requester.name}” asking for extra service ⌛⏰'
+    obj = _load("extra_hours_service_request_payment_success", service_id, snapshot)
+    title = f'“{obj.requester_name}” asking for extra service ⌛⏰'
     body = f'Please check your portal and accept your client extra service for client satisfaction 💼👍'
-    send_user_notification(obj.assigned_service_provider.user_id, title, body)
-    extra_service_request_payment_done(service_id)
+    if obj.provider_user_id:
+        send_user_notification(obj.provider_user_id, title, body)
+    extra_service_request_payment_done(service_id, snapshot={
+        "requester_name": obj.requester_name, "parent_assign_ids": obj.parent_assign_ids
+    })
     
 @app.task
-def service_request_completed(service_id):
-    obj = ServiceRequest.objects.get(pk=service_id)
-    title = f'“{obj.service_feature.name}“ status 👍 Completed 👍'
-    body = f'“{obj.service_feature.name}“ has been completed successfully 👍'
+def service_request_completed(service_id, snapshot=None):
+    obj = _load("service_request_completed", service_id, snapshot)
+    title, body = render_message("service_request_completed", {"feature": obj.feature_name})
     send_user_notification(obj.requester_id, title, body)
+
+@app.task
+def dispatch_notifications():
+    from flogapp.services.notifications import OutboxDispatcher
+    return OutboxDispatcher().run()
+
+@app.task
+def reconcile_payments():
+    from flogapp.services.payments import reconcile_pending_payments
+    return reconcile_pending_payments()
+
+@app.on_after_finalize.connect
+def setup_periodic_tasks(sender, **kwargs):
+    # the outbox is drained every minute; overlapping runs are safe since each claims its own rows
+    sender.add_periodic_task(crontab(), dispatch_notifications.s(), name="dispatch service notifications")
+    # settling is conditional, so a reconcile overlapping a callback or another run settles nothing twice
+    sender.add_periodic_task(crontab(minute="*/10"), reconcile_payments.s(), name="reconcile service payments")
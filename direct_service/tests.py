@@ -1,3 +1,297 @@
-from django.test import TestCase
+import threading
+from datetime import date, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from flogapp.accounts.choices import CurrentCityChoices, RoleChoices
+from flogapp.accounts.models import Address, UserDeviceToken
+from flogapp.payments.choices import PaymentStatusChoices
+from flogapp.payments.models import ServiceRequestPayment
+from flogapp.taskapp.celery import app
+from . import payments, tasks
+from .catalog import get_catalog
+from .choices import FieldTypeChoices, ServiceRequestStatusChoices
+from .models import (
+    Feature, Service, ServiceField, ServiceProvider, ServiceProviderService, ServiceProviderTarget, ServiceRequest,
+    ServiceRequestValues
+)
+from .payments import MyFatoorahGateway, reconcile_pending_payments
+from .stub_gateway import start_stub_gateway
+from .transitions import TRANSITIONS, TransitionConflict, apply_transition
+from .views import ServiceRequestPaymentCallbackView, ServiceRequestViewSet
+
+User = get_user_model()
+
+
+def create_catalog():
+    service = Service.objects.create(name="Cleaning", cover_photo="services/cover.png")
+    feature = Feature.objects.create(service=service, name="Home cleaning", cover_photo="services/cover.png", cities=[])
+    field = ServiceField.objects.create(
+        service_feature=feature, field_name="hours", label="Hours", field_type=FieldTypeChoices.INTEGER,
+        is_price_unit_field=True, price_per_unit=10
+    )
+    return feature, field
+
+
+def create_client(email, phone):
+    user = User.objects.create(email=email, phone=phone, name="Client", role=RoleChoices.CLIENT)
+    return user, Address.objects.create()
+
+
+def create_provider(email, phone, cities=()):
+    user = User.objects.create(email=email, phone=phone, name="Provider", role=RoleChoices.SERVICE_PROVIDER)
+    return ServiceProvider.objects.create(
+        name="Provider", user=user, cover_photo="services/cover.png", licence="services/licence.pdf",
+        passport="services/passport.pdf", licence_start=date.today(), licence_end=date.today(),
+        residence_photo="services/residence.png", contract_info="services/contract.pdf", cities=list(cities)
+    )
+
+
+class RecordingSender:
+    """Keeps the tokens of every multicast instead of sending them."""
+    tokens = []
+
+    def send_multicast(self, tokens, title, body):
+        RecordingSender.tokens.extend(tokens)
+
+
+class ServiceRequestQueryCountTests(TestCase):
+    """Listing and retrieving requests costs the same queries however many rows and extra requests there are."""
+
+    @classmethod
+    def setUpTestData(cls):
+        feature, field = create_catalog()
+        cls.requester, address = create_client("client@example.com", "500000001")
+
+        def create_request(parent=None):
+            return ServiceRequest.objects.create(
+                service_feature=feature, requester=cls.requester, address=address,
+                primary_schedule=timezone.now(), price=10, parent=parent
+            )
+
+        cls.childless = create_request()
+        cls.roots = []
+        for _ in range(100):
+            root = create_request()
+            # an extra request with an extra request of its own
+            create_request(create_request(root))
+            ServiceRequestValues.objects.create(service_request=root, service_field=field, value="2")
+            cls.roots.append(root)
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # the catalog snapshot is built once per version, not per request
+        get_catalog()
+
+    def list(self, limit):
+        request = self.factory.get("/service-requests/", {"limit": limit})
+        force_authenticate(request, user=self.requester)
+        return ServiceRequestViewSet.as_view({"get": "list"})(request)
+
+    def retrieve(self, service_request):
+        request = self.factory.get(f"/service-requests/{service_request.id}/")
+        force_authenticate(request, user=self.requester)
+        return ServiceRequestViewSet.as_view({"get": "retrieve"})(request, pk=str(service_request.id))
+
+    def test_list_page_of_100_costs_the_queries_of_a_page_of_10(self):
+        with CaptureQueriesContext(connection) as page_of_10:
+            self.assertEqual(self.list(10).status_code, 200)
+        with self.assertNumQueries(len(page_of_10)):
+            response = self.list(100)
+        self.assertEqual(len(response.data["results"]), 100)
+        extra_request = response.data["results"][0]["extra_request"]
+        self.assertEqual(len(extra_request), 1)
+        self.assertEqual(len(extra_request[0]["extra_request"]), 1)
+
+    def test_retrieve_with_extra_requests_costs_the_queries_of_a_lone_request(self):
+        with CaptureQueriesContext(connection) as lone_request:
+            self.assertEqual(self.retrieve(self.childless).status_code, 200)
+        with self.assertNumQueries(len(lone_request)):
+            response = self.retrieve(self.roots[0])
+        self.assertEqual(len(response.data["extra_request"]), 1)
+        self.assertEqual(len(response.data["extra_request"][0]["extra_request"]), 1)
+
+
+@override_settings(NOTIFICATION_SENDER=f"{__name__}.RecordingSender")
+class NewJobFanOutTests(TestCase):
+
+    def setUp(self):
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, "task_always_eager", False)
+        RecordingSender.tokens = []
+
+    def offer(self, token, phone, service, city):
+        provider = create_provider(f"{token}@example.com", phone, [city])
+        ServiceProviderService.objects.create(service=service, service_provider=provider, price_per_unit=10)
+        UserDeviceToken.objects.create(user=provider.user, device_token=token)
+        ServiceProviderTarget.objects.refresh_provider(provider)
+
+    def test_approving_a_request_alerts_only_suppliers_of_its_service_in_its_cities(self):
+        city, other_city = CurrentCityChoices.values[:2]
+        feature, _ = create_catalog()
+        feature.cities = [city]
+        feature.save()
+        other_service = Service.objects.create(name="Plumbing", cover_photo="services/cover.png")
+        self.offer("matching", "500000011", feature.service, city)
+        self.offer("other-city", "500000012", feature.service, other_city)
+        self.offer("other-service", "500000013", other_service, city)
+        requester, address = create_client("client@example.com", "500000001")
+        service_request = ServiceRequest.objects.create(
+            service_feature=feature, requester=requester, address=address, primary_schedule=timezone.now(),
+            price=10, status=ServiceRequestStatusChoices.PENDING
+        )
+        admin = User.objects.create(email="admin@example.com", phone="500000002", name="Admin", is_staff=True,
+                                    is_superuser=True)
+        request = APIRequestFactory().patch(f"/service-requests/{service_request.id}/approve/")
+        force_authenticate(request, user=admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = ServiceRequestViewSet.as_view({"patch": "approve"})(request, pk=str(service_request.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RecordingSender.tokens, ["matching"])
+
+
+class PaymentSettlementTests(TestCase):
+    """Callbacks and the reconciler read invoice statuses back from the stub gateway and settle each invoice once."""
+
+    def setUp(self):
+        server = start_stub_gateway()
+        self.addCleanup(server.shutdown)
+        self.invoices = server.invoices
+        self.gateway = MyFatoorahGateway(base_url=server.url, backoff=0)
+        patcher = mock.patch.object(payments, "_gateway", self.gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.feature, _ = create_catalog()
+        self.requester, self.address = create_client("client@example.com", "500000001")
+
+    def checkout(self):
+        service_request = ServiceRequest.objects.create(
+            service_feature=self.feature, requester=self.requester, address=self.address,
+            primary_schedule=timezone.now(), price=10, status=ServiceRequestStatusChoices.PAYMENT_PENDING
+        )
+        invoice = self.gateway.checkout(10, {
+            "customer_name": "Client", "mobile": "500000001", "email": "client@example.com", "price": 10,
+            "callback_url": "http://testserver/service-request/payments",
+            "error_url": "http://testserver/service-request/payments", "customer_reference": "test",
+            "items": [{"item_name": "Client", "item_quantity": 1, "item_price": 10, "tax_amount": 0}],
+        })
+        ServiceRequestPayment.objects.create(
+            service_request=service_request, user=self.requester, price=10, invoice_id=invoice["invoice_id"],
+            payment_url=invoice["payment_url"], status=PaymentStatusChoices.PENDING, tax_amount=0,
+            price_with_tax=10, loylity_points=0, amount_discounted=0
+        )
+        return service_request, invoice
+
+    def callback(self, payment_id):
+        request = APIRequestFactory().get("/service-request/payments", {"paymentId": payment_id})
+        return ServiceRequestPaymentCallbackView.as_view()(request)
+
+    def assertSettled(self, service_request, payment_status, request_status):
+        self.assertEqual(ServiceRequestPayment.objects.get(service_request=service_request).status, payment_status)
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.status, request_status)
+
+    def test_reconcile_settles_paid_and_fails_failed_invoices(self):
+        paid, paid_invoice = self.checkout()
+        failed, failed_invoice = self.checkout()
+        pending, _ = self.checkout()
+        self.invoices[paid_invoice["invoice_id"]] = "Paid"
+        self.invoices[failed_invoice["invoice_id"]] = "Failed"
+        self.assertEqual(reconcile_pending_payments(older_than=timedelta(0)), (3, 1))
+        self.assertSettled(paid, PaymentStatusChoices.COMPLETE, ServiceRequestStatusChoices.PENDING)
+        self.assertSettled(failed, PaymentStatusChoices.FAILED, ServiceRequestStatusChoices.PAYMENT_PENDING)
+        self.assertSettled(pending, PaymentStatusChoices.PENDING, ServiceRequestStatusChoices.PAYMENT_PENDING)
+
+    def test_a_reconcile_and_duplicate_callbacks_settle_a_paid_invoice_once(self):
+        service_request, invoice = self.checkout()
+        self.invoices[invoice["invoice_id"]] = "Paid"
+        with mock.patch.object(tasks, "enqueue_on_commit") as enqueue:
+            self.assertEqual(reconcile_pending_payments(older_than=timedelta(0)), (1, 1))
+            for _ in range(2):
+                response = self.callback(invoice["payment_id"])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data["status"], PaymentStatusChoices.COMPLETE)
+        self.assertEqual(enqueue.call_args_list, [mock.call(tasks.pending_for_approval, service_request)])
+        self.assertSettled(service_request, PaymentStatusChoices.COMPLETE, ServiceRequestStatusChoices.PENDING)
+
+
+class SupplierAcceptTests(TestCase):
+
+    def test_accepting_an_accepted_request_updates_no_rows(self):
+        feature, _ = create_catalog()
+        requester, address = create_client("client@example.com", "500000001")
+        service_request = ServiceRequest.objects.create(
+            service_feature=feature, requester=requester, address=address, primary_schedule=timezone.now(),
+            price=10, status=ServiceRequestStatusChoices.APPROVED
+        )
+        first = create_provider("first@example.com", "500000011")
+        second = create_provider("second@example.com", "500000012")
+        apply_transition(service_request, "supplier_accept", assigned_service_provider_id=first.id)
+        # the compare-and-set UPDATE a second accept runs no longer matches the row
+        self.assertEqual(ServiceRequest.objects.filter(
+            pk=service_request.pk, status__in=TRANSITIONS["supplier_accept"].get_sources(service_request)
+        ).update(status=ServiceRequestStatusChoices.ACCEPTED, assigned_service_provider_id=second.id), 0)
+        with self.assertRaises(TransitionConflict) as conflict:
+            apply_transition(
+                ServiceRequest(pk=service_request.pk, parent_id=None), "supplier_accept",
+                assigned_service_provider_id=second.id
+            )
+        self.assertEqual(conflict.exception.status_code, status.HTTP_409_CONFLICT)
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.assigned_service_provider_id, first.id)
+
+
+@skipIf(connection.vendor == "sqlite", "SQLite takes one writer at a time, so the accepts cannot race.")
+class SupplierAcceptRaceTests(TransactionTestCase):
+    """Simultaneous accepts of one request, each on its own connection, as separate requests would be."""
+    accepts = 100
+
+    def setUp(self):
+        feature, _ = create_catalog()
+        requester, address = create_client("client@example.com", "500000001")
+        self.service_request = ServiceRequest.objects.create(
+            service_feature=feature, requester=requester, address=address, primary_schedule=timezone.now(),
+            price=10, status=ServiceRequestStatusChoices.APPROVED
+        )
+        self.provider_ids = [
+            create_provider(f"provider{index}@example.com", f"6000{index:05}").id for index in range(self.accepts)
+        ]
+
+    def test_exactly_one_accept_wins_and_the_rest_conflict(self):
+        barrier = threading.Barrier(self.accepts)
+        outcomes = {}
+
+        def accept(provider_id):
+            service_request = ServiceRequest(pk=self.service_request.pk, parent_id=None)
+            barrier.wait()
+            try:
+                with transaction.atomic():
+                    apply_transition(service_request, "supplier_accept", assigned_service_provider_id=provider_id)
+                outcomes[provider_id] = status.HTTP_200_OK
+            except TransitionConflict as err:
+                outcomes[provider_id] = err.status_code
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(provider_id,)) for provider_id in self.provider_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [provider_id for provider_id, code in outcomes.items() if code == status.HTTP_200_OK]
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(
+            sorted(code for code in outcomes.values() if code != status.HTTP_200_OK),
+            [status.HTTP_409_CONFLICT] * (self.accepts - 1)
+        )
+        self.service_request.refresh_from_db()
+        self.assertEqual(self.service_request.status, ServiceRequestStatusChoices.ACCEPTED)
+        self.assertEqual(self.service_request.assigned_service_provider_id, winners[0])
@@ -0,0 +1,51 @@
+from .choices import ServiceRequestStatusChoices
+
+WORK_HISTORY_STEPS = (
+    ("payment-successfull", "Payment done", ServiceRequestStatusChoices.PENDING),
+    ("approved", "Service Request Approved", ServiceRequestStatusChoices.APPROVED),
+    ("accepted", "Supplier Accepted", ServiceRequestStatusChoices.ACCEPTED),
+    ("inprogress", "Service Request in progress", ServiceRequestStatusChoices.INPROGRESS),
+    ("completed-by-provider", "Service Request Completed By Service Provider", ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER),
+    ("completed", "Service Request Completed", ServiceRequestStatusChoices.COMPLETED),
+)
+EXTRA_REQUEST_HISTORY_STEPS = (
+    ("pending", "Supplier Accepted", ServiceRequestStatusChoices.PENDING),
+    ("payment-done", "Extra Service Request Payment Done", ServiceRequestStatusChoices.INPROGRESS),
+)
+# how many extra request steps are done in each status; the rest count none
+EXTRA_REQUEST_DONE = {
+    ServiceRequestStatusChoices.ACCEPTED: 1,
+    ServiceRequestStatusChoices.INPROGRESS: 2,
+    ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER: 2,
+    ServiceRequestStatusChoices.COMPLETED: 2,
+}
+
+
+def _build(steps, done):
+    return tuple(
+        {"type": type, "title": title, "status": status, "done": index < done}
+        for index, (type, title, status) in enumerate(steps)
+    )
+
+
+STATUS_INDEX = {status: index for index, (_, _, status) in enumerate(WORK_HISTORY_STEPS)}
+# every step up to and including the request's status is done; an unlisted status has none done
+WORK_HISTORY = {status: _build(WORK_HISTORY_STEPS, index + 1) for status, index in STATUS_INDEX.items()}
+WORK_HISTORY_NOT_STARTED = _build(WORK_HISTORY_STEPS, 0)
+EXTRA_REQUEST_HISTORY = {status: _build(EXTRA_REQUEST_HISTORY_STEPS, done) for status, done in EXTRA_REQUEST_DONE.items()}
+EXTRA_REQUEST_HISTORY_NOT_STARTED = _build(EXTRA_REQUEST_HISTORY_STEPS, 0)
+
+
+def get_timeline(status, is_extra_request=False, extra_histories=()):
+    """
+    The request_history of a request in ``status``. A request's extra request histories go before
+    its final step. The step dicts are shared between responses and must not be modified.
+    """
+    if is_extra_request:
+        return list(EXTRA_REQUEST_HISTORY.get(status, EXTRA_REQUEST_HISTORY_NOT_STARTED))
+    steps = WORK_HISTORY.get(status, WORK_HISTORY_NOT_STARTED)
+    history = list(steps[:-1])
+    for extra_history in extra_histories:
+        history.extend(extra_history)
+    history.append(steps[-1])
+    return history
@@ -0,0 +1,86 @@
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .choices import ServiceRequestStatusChoices
+from .counts import invalidate_request_counts
+from .models import ServiceRequest
+
+
+class TransitionConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Service request status changed, reload and try again."
+    default_code = "conflict"
+
+
+class Transition:
+    """
+    Moves a request to ``target`` from one of ``sources`` (``extra_sources`` for extra requests).
+    ``conflict`` is the message for a request found in any other status.
+    """
+
+    def __init__(self, target, sources, conflict, extra_sources=None):
+        self.target = target
+        self.sources = tuple(sources)
+        self.extra_sources = tuple(sources if extra_sources is None else extra_sources)
+        self.conflict = conflict
+
+    def get_sources(self, service_request):
+        return self.extra_sources if service_request.parent_id else self.sources
+
+
+TRANSITIONS = {
+    "approve": Transition(
+        ServiceRequestStatusChoices.APPROVED,
+        [ServiceRequestStatusChoices.PENDING],
+        "Service request is not waiting for approval."
+    ),
+    "reject": Transition(
+        ServiceRequestStatusChoices.REJECTED,
+        [ServiceRequestStatusChoices.PENDING, ServiceRequestStatusChoices.APPROVED],
+        "Service request can no longer be rejected."
+    ),
+    "supplier_accept": Transition(
+        ServiceRequestStatusChoices.ACCEPTED,
+        [ServiceRequestStatusChoices.APPROVED],
+        "Service request is not open for acceptance or already accepted by some other supplier.",
+        extra_sources=[ServiceRequestStatusChoices.PENDING]
+    ),
+    "mark_inprogress": Transition(
+        ServiceRequestStatusChoices.INPROGRESS,
+        [ServiceRequestStatusChoices.ACCEPTED],
+        "Request is not approved."
+    ),
+    "mark_completed": Transition(
+        ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER,
+        [ServiceRequestStatusChoices.INPROGRESS],
+        "Service is not in progress."
+    ),
+    "accept_completion": Transition(
+        ServiceRequestStatusChoices.COMPLETED,
+        [ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER],
+        "Service is not marked as completed by provider."
+    ),
+}
+
+
+def apply_transition(service_request, name, **changes):
+    """
+    Run transition ``name`` as one ``UPDATE ... WHERE status IN (sources)`` writing only the status,
+    ``updated`` and ``changes``. Raises TransitionConflict when another request got there first;
+    on success ``service_request`` is updated in place.
+    """
+    transition = TRANSITIONS[name]
+    now = timezone.now()
+    updated = ServiceRequest.objects.filter(
+        pk=service_request.pk, status__in=transition.get_sources(service_request)
+    ).update(status=transition.target, updated=now, **changes)
+    if not updated:
+        current = ServiceRequest.objects.filter(pk=service_request.pk).values_list("status", flat=True).first()
+        raise TransitionConflict({"status": transition.conflict, "current_status": current})
+    invalidate_request_counts([service_request.pk])
+    service_request.status = transition.target
+    service_request.updated = now
+    for field, value in changes.items():
+        setattr(service_request, field, value)
+    return service_request
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+# the viewsets are registered on flogapp's API router; include these at the site root, since
+# checkout hands the gateway f"{settings.BASE_URL}/service-request/payments" with no trailing slash
+urlpatterns = [
+    path("service-request/payments", views.ServiceRequestPaymentCallbackView.as_view(), name="service_request_payments"),
+]
@@ -1,24 +1,23 @@
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Exists, Q
 from django.conf import settings
 from django.forms.models import model_to_dict
-from django.db.models import Sum
 from rest_framework import status, permissions
 from rest_framework.viewsets import ModelViewSet
+from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
 
 from flogapp.core.bases.choices import StatusChoices
-from flogapp.core.bases.pagination import LimitPagination
-from flogapp.core.models import PromoCode
+from flogapp.core.models import GenericObject, PromoCode
 from flogapp.core.bases import permissions as flogapp_permissions
 from flogapp.accounts.choices import RoleChoices
 from flogapp.accounts.models import UserPromoCode
 from flogapp.accounts.serializers import UserCreateSerializer, UserSerializer
+from flogapp.payments.choices import LoylityPointsChoices, PaymentStatusChoices
 from flogapp.payments.utils import check_and_deduct_apply_promo_code_or_points
-from flogapp.myfatoorah import initiate_payment, execute_payment, check_is_success
-from flogapp.payments.models import ServiceRequestPayment
+from flogapp.payments.models import LoylityPoints, ServiceRequestPayment
 from .serializers import (
     ServiceSerializer,
     ServiceFeatureSerializer,
@@ -35,15 +34,25 @@ from .models import (
     ServiceProviderEmployee,
     ServiceRequest,
     ServiceRequestRating,
-    ServiceProviderRejectedService
+    ServiceProviderRejectedService,
+    ServiceProviderInbox,
+    ServiceProviderStats
 )
-from .choices import FieldTypeChoices, ServiceRequestStatusChoices
+from .choices import FieldTypeChoices, ServiceRequestStatusChoices, ProviderInboxReasonChoices
 from .filters import ServiceFilter, ServiceFeaturerFilter, ServiceRequestFilter, ServiceProviderFilter
-from .tasks import *
+from .schema import get_feature_schema, invalidate_feature_schema
+from .catalog import get_catalog
+from .counts import estimate_request_count, get_request_count
+from .mixins import ConditionalGetMixin
+from .notifications import notify
+from .pagination import KeysetPagination
+from .transitions import apply_transition
+from .payments import PaymentGatewayError, get_payment_gateway, settle_invoices
+from .tasks import enqueue_on_commit, extra_hours_service_request, new_service_request
 
-class ServiceViewSet(ModelViewSet):
+class ServiceViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = ServiceSerializer
-    pagination_class = LimitPagination
+    pagination_class = KeysetPagination
     filter_class = ServiceFilter
     def get_queryset(self):
         if self.request.user.is_admin_user:
@@ -56,12 +65,16 @@ class ServiceViewSet(ModelViewSet):
 
     @action(url_path="dropdown", detail=False, methods=["GET"])
     def dropdown(self, request, *args, **kwargs):
-        return Response(self.get_queryset().filter(parent__isnull=True).values('id', 'name'))
+        return get_catalog().get_document("service-dropdown", request.user.is_admin_user).as_response(request)
+
+    @action(url_path="catalog", detail=False, methods=["GET"])
+    def catalog(self, request, *args, **kwargs):
+        return get_catalog().get_document("tree", request.user.is_admin_user).as_response(request)
     
     
-class ServiceFeaturerViewSet(ModelViewSet):
+class ServiceFeaturerViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = ServiceFeatureSerializer
-    pagination_class = LimitPagination
+    pagination_class = KeysetPagination
     filter_class = ServiceFeaturerFilter
     
     def get_queryset(self):
@@ -94,103 +107,134 @@ class ServiceFeaturerViewSet(ModelViewSet):
             return Response(status=status.HTTP_404_NOT_FOUND)
         field.is_active = not field.is_active
         field.save()
+        invalidate_feature_schema(instance.id)
         return Response({"message": "success"})
 
     @classmethod
     def _pay(cls, request, service_request):
-        CALLBACK_URL = f"{settings.BASE_URL}/service-request/payments"
-        ERROR_URL = f"{settings.BASE_URL}/service-request/payments"
-        print(service_request.price)
+        with transaction.atomic():
+            payment_obj, discount = cls._create_payment(request, service_request)
+        return cls._checkout(payment_obj, discount)
+
+    @classmethod
+    def _create_payment(cls, request, service_request):
+        """
+        The pending payment priced with the promo code or points, and the ``(promo_code, loylity_points)``
+        to spend once checkout succeeds. The gateway is not called yet.
+        """
         try:
             promo_code, loylity_points, amount_discounted, discounted_price = check_and_deduct_apply_promo_code_or_points(request.user, request.data.copy(), service_request.price, service_request, PromoCode.ALL)
         except:
             promo_code, loylity_points, amount_discounted, discounted_price = check_and_deduct_apply_promo_code_or_points(request.user, request.data, service_request.price, service_request, PromoCode.ALL)
-        price = discounted_price
-        price_with_tax = price + service_request.tax_amount
-        payment_initial = initiate_payment(price_with_tax)
-        if not check_is_success(payment_initial):
-            return Response(data={"paymet": "Payment initiation Failed"}, status=status.HTTP_400_BAD_REQUEST)
+        price_with_tax = discounted_price + service_request.tax_amount
         user = service_request.requester or request.user
-        phone = user.phone
-        if phone and phone.startswith("+971"):
-            phone = phone[len("+971"):]  # python9: phone.removeprefix("+971")
-        data = {
-            "customer_name": user.name,
-            "mobile": phone,
-            "email": user.email,
-            "price": price_with_tax,
-            "callback_url": CALLBACK_URL,
-            "error_url": ERROR_URL,
-            "customer_reference": "POP: Banner, SD: NA",
-            "items": [{
-                "item_name": user.name,
-                "item_quantity": 1,
-                "item_price":price,
-                "tax_amount": service_request.tax_amount
-            }]
-        }
-        payment = execute_payment(data)
-        if not check_is_success(payment):
-            return Response(data={"paymet": "Payment initiation Failed"}, status=status.HTTP_400_BAD_REQUEST)
-        resp = {
-            "payment_url": payment.get("Data", {}).get("PaymentURL"),
-            "payment_id": payment.get("Data", {}).get("InvoiceTransactions", [{}])[0].get("PaymentId"),
-            "invoice_id": payment.get("Data", {}).get("InvoiceId"),
-        }
         user_promo_code = None
         data = {
             "service_request": service_request,
             "user": user,
             "price": discounted_price,
-            "invoice_id": resp.get("invoice_id"),
-            "payment_url": resp.get("payment_url"),
-            "status": StatusChoices.PENDING,
+            "invoice_id": None,
+            "payment_url": None,
+            "status": PaymentStatusChoices.PENDING,
             "tax_amount": service_request.tax_amount,
             "price_with_tax": price_with_tax,
             "user_promo_code": user_promo_code,
             "loylity_points": 0,
             "amount_discounted": amount_discounted or 0,
         }
-        payment_obj = ServiceRequestPayment.objects.create(**data)
+        return ServiceRequestPayment.objects.create(**data), (promo_code, loylity_points)
+
+    @staticmethod
+    def _apply_discount(payment_obj, promo_code, loylity_points):
+        """Spend the promo code or points on a payment whose invoice exists, so a failed checkout has nothing to give back."""
+        user = payment_obj.user
         if loylity_points:
             payment_obj.loylity_points = loylity_points
             LoylityPoints.check_and_create_loylity_points_entry(
                 user,
                 LoylityPointsChoices.SERVICE_REQUEST_PAYMENT,
-                service_request,
+                payment_obj.service_request,
                 loylity_points
             )
         elif promo_code:
             user_promo_code = UserPromoCode.objects.create(
                 user=user,
                 promo_code=promo_code,
-                discounted_amount=amount_discounted,
+                discounted_amount=payment_obj.amount_discounted,
                 payment_object = GenericObject.get_from_instance(payment_obj)
             )
             payment_obj.user_promo_code = user_promo_code
-        payment_obj.save()
+
+    @classmethod
+    def _checkout(cls, payment_obj, discount):
+        """
+        Create the gateway invoice for a saved payment, then spend ``discount`` on it. Makes remote calls,
+        so never run it inside a transaction. A failed checkout rejects the payment and returns a 400.
+        """
+        CALLBACK_URL = f"{settings.BASE_URL}/service-request/payments"
+        ERROR_URL = f"{settings.BASE_URL}/service-request/payments"
+        user = payment_obj.user
+        phone = user.phone
+        if phone and phone.startswith("+971"):
+            phone = phone[len("+971"):]  # python9: phone.removeprefix("+971")
+        data = {
+            "customer_name": user.name,
+            "mobile": phone,
+            "email": user.email,
+            "price": payment_obj.price_with_tax,
+            "callback_url": CALLBACK_URL,
+            "error_url": ERROR_URL,
+            "customer_reference": "POP: Banner, SD: NA",
+            "items": [{
+                "item_name": user.name,
+                "item_quantity": 1,
+                "item_price": payment_obj.price,
+                "tax_amount": payment_obj.tax_amount
+            }]
+        }
+        try:
+            invoice = get_payment_gateway().checkout(payment_obj.price_with_tax, data)
+        except PaymentGatewayError:
+            payment_obj.status = PaymentStatusChoices.FAILED
+            payment_obj.save()
+            return Response(data={"paymet": "Payment initiation Failed"}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            payment_obj.invoice_id = invoice["invoice_id"]
+            payment_obj.payment_url = invoice["payment_url"]
+            cls._apply_discount(payment_obj, *discount)
+            payment_obj.save()
         return payment_obj
     
     def _create_service_request(self, request, service_feature, child=False):
-        ser = ServiceRequestSerializer(
-            data=request.data,
-            context={
-                "service_feature": service_feature,
-                "request": request,
-                "view": self
-            })
-        ser.is_valid(raise_exception=True)
-        if child:
-            fields_to_inherit = ["address", "service_feature", "requester", "primary_schedule"]
-            parent = ser.validated_data["parent"]
-            for field in fields_to_inherit:
-                ser.validated_data[field] = getattr(parent, field)
-            ser.validated_data["status"] = ServiceRequestStatusChoices.PENDING
-        price = self._get_price(ser, service_feature)
-        ser.validated_data["price"] = price
-        instance = ser.save()
-        payment_obj = self._pay(request, instance)
+        with transaction.atomic():
+            ser = ServiceRequestSerializer(
+                data=request.data,
+                context={
+                    "service_feature": service_feature,
+                    "request": request,
+                    "view": self
+                })
+            ser.is_valid(raise_exception=True)
+            if child:
+                fields_to_inherit = ["address", "service_feature", "requester", "primary_schedule"]
+                parent = ser.validated_data["parent"]
+                for field in fields_to_inherit:
+                    ser.validated_data[field] = getattr(parent, field)
+                ser.validated_data["status"] = ServiceRequestStatusChoices.PENDING
+            price = self._get_price(ser, service_feature)
+            ser.validated_data["price"] = price
+            instance = ser.save()
+            if child and instance.parent.assigned_service_provider_id:
+                ServiceProviderInbox.objects.set_reason(
+                    instance, instance.parent.assigned_service_provider, ProviderInboxReasonChoices.PARENT_ASSIGNED
+                )
+            payment_obj, discount = self._create_payment(request, instance)
+        payment_obj = self._checkout(payment_obj, discount)
         if not type(payment_obj)==ServiceRequestPayment:
+            # the request was committed before checkout; without an invoice it can never be paid
+            with transaction.atomic():
+                ServiceRequestPayment.objects.filter(service_request=instance).delete()
+                ServiceRequest.objects.discard(instance)
             return payment_obj
         data = ServiceRequestSerializer(instance, context={
             "request": request,
@@ -198,16 +242,14 @@ class ServiceFeaturerViewSet(ModelViewSet):
         }).data
         data["payment_url"] = payment_obj.payment_url
         if child:
-            extra_hours_service_request.delay(instance.parent.id)
+            enqueue_on_commit(extra_hours_service_request, instance.parent)
         return Response(data)
     
-    @transaction.atomic
     @action(url_path="service-request", detail=True, methods=["POST"])    
     def service_request(self, request, pk, *args, **kwargs):
         service_feature = self.get_object()
         return self._create_service_request(request, service_feature)
 
-    @transaction.atomic
     @action(url_path="extra-service-request", detail=True, methods=["POST"])    
     def extra_service_request(self, request, pk, *args, **kwargs):
         service_feature = self.get_object()
@@ -216,45 +258,69 @@ class ServiceFeaturerViewSet(ModelViewSet):
         return self._create_service_request(request, service_feature, child=True)
     
     def _get_price(self, ser, service_feature):
-        price = 0
-        import decimal
-        for field_name, config_field in ser.extra_fields.items():
-            if config_field.is_price_unit_field:
-                if config_field.field_type==FieldTypeChoices.BOOLEAN and ser.validated_data[field_name]:
-                    price = price + config_field.price_per_unit
-                else:
-                    price = price + (config_field.price_per_unit * decimal.Decimal(ser.validated_data[field_name]))
-        return price
+        return get_feature_schema(service_feature.id).get_price(ser.validated_data)
+
+    @staticmethod
+    def _quote_response(price):
+        return {
+            "price": price,
+            "tax_amount": 0,
+            "price_with_tax": price
+        }
     
     @action(url_path="get-service-request-price", detail=True, methods=["POST"])    
     def service_request_price(self, request, pk, *args, **kwargs):
         service_feature = self.get_object()
-        ser_context = {
-                "service_feature": service_feature,
-                "request": request
-            }
-        ser = ServiceRequestSerializer(
-            data=request.data,
-            context={
-                "service_feature": service_feature,
-                "request": request,
-                "view":self
-            })
-        ser.is_valid(raise_exception=True)
-        price = self._get_price(ser, service_feature)
-        return Response({
-            "price": price,
-            "tax_amount": 0,
-            "price_with_tax": price
-        })
+        price = get_feature_schema(service_feature.id).quote(request.data)
+        return Response(self._quote_response(price))
+
+    @staticmethod
+    def _parse_quote(quote):
+        """``(feature_id, inputs, errors)`` for one batch entry; a malformed entry only fails itself."""
+        if not isinstance(quote, dict):
+            return None, None, {"non_field_errors": "Expected {\"feature\": id, \"inputs\": {...}}."}
+        feature_id = quote.get("feature")
+        if isinstance(feature_id, str) and feature_id.isdigit():
+            feature_id = int(feature_id)
+        if isinstance(feature_id, bool) or not isinstance(feature_id, int):
+            return None, None, {"feature": "A feature id is required."}
+        inputs = quote.get("inputs") or {}
+        if not isinstance(inputs, dict):
+            return feature_id, None, {"inputs": "Expected an object of field values."}
+        return feature_id, inputs, None
+
+    @action(url_path="get-service-request-prices", detail=False, methods=["POST"])
+    def service_request_prices(self, request, *args, **kwargs):
+        quotes = request.data.get("quotes") if isinstance(request.data, dict) else None
+        if not isinstance(quotes, list) or not quotes:
+            raise ValidationError({"quotes": "A list of {\"feature\": id, \"inputs\": {...}} is required."})
+        parsed = [self._parse_quote(quote) for quote in quotes]
+        feature_ids = set(self.get_queryset().filter(
+            id__in=[feature_id for feature_id, _, errors in parsed if not errors]
+        ).values_list("id", flat=True))
+        results = []
+        for quote, (feature_id, inputs, errors) in zip(quotes, parsed):
+            if errors:
+                results.append({"feature": quote.get("feature") if isinstance(quote, dict) else None, "errors": errors})
+                continue
+            if feature_id not in feature_ids:
+                results.append({"feature": feature_id, "errors": {"feature": "Not found."}})
+                continue
+            try:
+                price = get_feature_schema(feature_id).quote(inputs)
+            except ValidationError as err:
+                results.append({"feature": feature_id, "errors": err.detail})
+                continue
+            results.append({"feature": feature_id, **self._quote_response(price)})
+        return Response(results)
 
     @action(url_path="dropdown", detail=False, methods=["GET"])
     def dropdown(self, request, *args, **kwargs):
-        return Response(self.get_queryset().values('id', 'name', 'service__name'))
+        return get_catalog().get_document("feature-dropdown", request.user.is_admin_user).as_response(request)
     
 class ServiceProviderViewSet(ModelViewSet):
     serializer_class = ServiceProviderSerializer
-    pagination_class = LimitPagination
+    pagination_class = KeysetPagination
     filter_class = ServiceProviderFilter
     def get_queryset(self):
         qs = ServiceProvider.objects.all().order_by("-created")
@@ -286,35 +352,21 @@ class ServiceProviderViewSet(ModelViewSet):
     @action(url_path="get-total-earning", detail=True, methods=["GET"], permission_classes=(permissions.IsAuthenticated, ))
     def total_earning(self, request, pk, *args, **kwargs):
         service_provider = self.get_object()
-        return Response(service_provider.servicerequest_set.aggregate(total=Sum("price")))
+        stats = ServiceProviderStats.objects.filter(service_provider=service_provider).first()
+        return Response({
+            "total": stats.earnings if stats else 0,
+            "monthly": service_provider.monthly_stats.order_by("-month").values("month", "earnings")
+        })
         
-class ServiceRequestViewSet(ModelViewSet):
+class ServiceRequestViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = ServiceRequestSerializer
-    pagination_class = LimitPagination
+    pagination_class = KeysetPagination
     filter_class = ServiceRequestFilter
     def get_queryset(self):
-        qs = ServiceRequest.objects.prefetch_related('extra_service_request', 'assign').order_by("-created")
+        qs = ServiceRequest.objects.order_by("-created")
         
         if self.request.user.role==RoleChoices.SERVICE_PROVIDER:
-            service_provided = self.request.user.service_provider.services.all()
-            filter_q = (
-                Q(
-                    status=ServiceRequestStatusChoices.APPROVED, service_feature__service__in=service_provided
-                )
-                |
-                Q(
-                    assigned_service_provider=self.request.user.service_provider
-                )
-                |
-                Q(
-                    parent__assigned_service_provider=self.request.user.service_provider
-                )
-                |
-                Q(
-                    service_provider_rejected=self.request.user.service_provider
-                )
-            )
-            qs = qs.filter(filter_q)
+            qs = qs.filter(provider_inbox__service_provider=self.request.user.service_provider)
         elif self.request.user.role==RoleChoices.SERVICE_PROVIDER_EMPLOYEE:
             qs = qs.filter(
                 assign=self.request.user
@@ -325,14 +377,32 @@ class ServiceRequestViewSet(ModelViewSet):
             qs = qs.filter(requester=self.request.user)
         if self.action in ["list"]:
             qs = qs.filter(parent__isnull=True)
-        qs = qs.select_related(
-            "assigned_service_provider", "requester", "service_feature"
-        ).prefetch_related(
-            "suppliers_rejected",
-            "assign"
-        )
+        if self.action in ["list"]:
+            qs = ServiceRequestSerializer.setup_eager_loading(qs)
         return qs
 
+    def paginate_queryset(self, queryset):
+        page = super(ServiceRequestViewSet, self).paginate_queryset(queryset)
+        if page is not None and self.action == "list":
+            page = ServiceRequestSerializer.load_trees(page)
+        return page
+
+    def retrieve(self, request, *args, **kwargs):
+        def respond():
+            context = self.get_serializer_context()
+            service_request = ServiceRequestSerializer.load_tree(self.get_object().id, context)
+            return Response(self.get_serializer(service_request, context=context).data)
+
+        return self.conditional_response(request, respond)
+
+    def get_validator_queryset(self):
+        queryset = super(ServiceRequestViewSet, self).get_validator_queryset()
+        # representations embed the extra requests below each request
+        if self.action == "retrieve":
+            tree_ids = ServiceRequest.objects.tree_ids(int(self.kwargs["pk"]))
+            return ServiceRequest.objects.filter(Exists(queryset), id__in=tree_ids)
+        return ServiceRequest.objects.filter(id__in=ServiceRequest.objects.tree_ids(queryset))
+
     def get_serializer_context(self):
         context = super(ServiceRequestViewSet, self).get_serializer_context()
         context["service_feature"] = getattr(self, "service_feature", None)
@@ -340,47 +410,58 @@ class ServiceRequestViewSet(ModelViewSet):
 
     @action(url_path="count", detail=False, methods=["GET"], permission_classes=(permissions.IsAuthenticated,))    
     def count(self, request, *args, **kwargs):
-        return Response({"count": self.get_queryset().count()})
+        params = request.query_params.dict()
+        approximate = params.pop("approximate", "").lower() == "true"
+        if approximate and request.user.is_admin_user and not params:
+            estimate = estimate_request_count()
+            if estimate is not None:
+                return Response({"count": estimate, "approximate": True})
+        count = get_request_count(
+            request.user, params, lambda: self.filter_queryset(self.get_queryset()).count()
+        )
+        return Response({"count": count})
     
+    @transaction.atomic
     @action(url_path="approve", detail=True, methods=["PATCH"], permission_classes=(permissions.IsAdminUser,))    
     def approve(self, request, pk, *args, **kwargs):
-        service_request = self.get_object()
-        if service_request.status == StatusChoices.APPROVED:
-            raise ValidationError({"status": "Already Approved"})
-        service_request.status = StatusChoices.APPROVED
-        service_request.save()
-        request_approved.delay(service_request.id)
+        service_request = apply_transition(self.get_object(), "approve")
+        ServiceProviderInbox.objects.open_to_providers(service_request)
+        notify("request_approved", service_request, [service_request.requester_id])
+        if not service_request.parent_id:
+            # approval is when a job opens to suppliers; extra requests only go to the parent's provider
+            enqueue_on_commit(new_service_request, service_request)
         return Response({"msg": "Service Request Approved."})
 
+    @transaction.atomic
     @action(url_path="reject", detail=True, methods=["PATCH"], permission_classes=(permissions.IsAdminUser,))    
     def reject(self, request, pk, *args, **kwargs):
         service_request = self.get_object()
         if not request.data.get('rejection_reason'):
             raise ValidationError({"rejection_reason": "This field is required."})
-        if service_request.status == StatusChoices.REJECTED:
-            raise ValidationError({"status": "Already Reject"})
-        service_request.status = StatusChoices.REJECTED
-        service_request.rejection_reason = request.data["rejection_reason"]
-        service_request.save()
-        request_rejected.delay(service_request.id)
+        apply_transition(service_request, "reject", rejection_reason=request.data["rejection_reason"])
+        ServiceProviderInbox.objects.close_to_providers(service_request)
+        ServiceProviderInbox.objects.refresh_status([service_request.id])
+        notify("request_rejected", service_request, [service_request.requester_id])
         return Response({"msg": "Service Request Rejected."})
 
+    @transaction.atomic
     @action(url_path="supplier-accept", detail=True, methods=["PATCH"], permission_classes=(flogapp_permissions.IsServiceProvider, )) 
     def supplier_accept(self, request, pk, *args, **kwargs):
-        service_request = self.get_object()
-        if not service_request.status == StatusChoices.APPROVED and not service_request.parent:
-            raise ValidationError({"status": "Service request is waiting for approval."})
-        elif service_request.status == ServiceRequestStatusChoices.ACCEPTED:
-            raise ValidationError({"status": "Service request already accepted by some other supplier."})
-        service_request.assigned_service_provider = request.user.service_provider
-        service_request.status = ServiceRequestStatusChoices.ACCEPTED
-        service_request.save()
+        service_request = apply_transition(
+            self.get_object(), "supplier_accept", assigned_service_provider=request.user.service_provider
+        )
+        ServiceProviderInbox.objects.assign(service_request, request.user.service_provider)
+        ServiceProviderStats.objects.record(
+            request.user.service_provider.id, service_request,
+            accepted=0 if service_request.parent_id else 1, earnings=service_request.price or 0
+        )
         if service_request.parent:
-            request_extra_hours_approved.delay(service_request.id)
+            notify("request_extra_hours_approved", service_request, [service_request.requester_id])
         else:
-            request_accepted.delay(service_request.id)
+            notify("request_accepted", service_request, [service_request.requester_id])
         return Response({"msg": "Service Request is assigned."})
 
+    @transaction.atomic
     @action(url_path="supplier-reject", detail=True, methods=["PATCH"], permission_classes=(flogapp_permissions.IsServiceProvider, ))
     def supplier_reject(self, request, pk, *args, **kwargs):
         service_request = self.get_object()
@@ -391,50 +472,70 @@ class ServiceRequestViewSet(ModelViewSet):
             service_request=service_request,
             rejection_reason = request.data.get("rejection_reason", "")
         )
+        ServiceRequest.objects.touch([service_request.id])
         service_request.service_provider_rejected.add(request.user.service_provider)
+        ServiceProviderInbox.objects.set_reason(
+            service_request, request.user.service_provider, ProviderInboxReasonChoices.REJECTED
+        )
+        is_root = not service_request.parent_id
+        ServiceProviderStats.objects.record(request.user.service_provider.id, service_request, rejected=int(is_root))
         if service_request.assigned_service_provider==request.user.service_provider:
             service_request.assigned_service_provider = None
             service_request.save()
+            ServiceProviderInbox.objects.unassign(service_request, request.user.service_provider)
+            ServiceProviderStats.objects.record(
+                request.user.service_provider.id, service_request,
+                accepted=-int(is_root), earnings=-(service_request.price or 0)
+            )
         if service_request.parent:
             service_request.rejection_reason = request.data["rejection_reason"]
             service_request.status = ServiceRequestStatusChoices.REJECTED
             service_request.save()
-            request_extra_hours_rejected.delay(service_request.id)
+            ServiceProviderInbox.objects.refresh_status([service_request.id])
+            notify("request_extra_hours_rejected", service_request, [service_request.requester_id])
         return Response({"msg": "Service Request is rejected."})
 
+    @transaction.atomic
     @action(url_path="mark-completed", detail=True, methods=["PATCH"])    
     def mark_completed_by_provider(self, request, pk, *args, **kwargs):
-        service_request = self.get_object()
-        print(service_request.status)
-        if service_request.status==ServiceRequestStatusChoices.INPROGRESS:
-            service_request.status = ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER
-            service_request.save()
-            service_request_completed.delay(service_request.id)
-            service_request.extra_service_request.filter(status=ServiceRequestStatusChoices.INPROGRESS).update(status = ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER)
-            return Response({"message": "Request marked as completed successfully."})
-        raise ValidationError({"status": "Service is not in progress."})
+        service_request = apply_transition(self.get_object(), "mark_completed")
+        notify("service_request_completed", service_request, [service_request.requester_id])
+        service_request.extra_service_request.filter(status=ServiceRequestStatusChoices.INPROGRESS).update(
+            status=ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER, updated=service_request.updated
+        )
+        ServiceProviderInbox.objects.refresh_status(
+            [service_request.id] + list(service_request.extra_service_request.values_list("id", flat=True))
+        )
+        return Response({"message": "Request marked as completed successfully."})
 
+    @transaction.atomic
     @action(url_path="accept-completion", detail=True, methods=["PATCH"])    
     def accept_completion(self, request, pk, *args, **kwargs):
-        service_request = self.get_object()
-        if service_request.status==ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER:
-            service_request.status = ServiceRequestStatusChoices.COMPLETED
-            service_request.save()
-            service_request.extra_service_request.filter(status=ServiceRequestStatusChoices.COMPLETED).update(status =ServiceRequestStatusChoices.COMPLETED)
-            request_completed_by_client.delay(service_request.id)
-            return Response({"message": "Request marked as completed successfully."})
-        raise ValidationError({"status": "Service is not marked as completed by provider."})
+        service_request = apply_transition(self.get_object(), "accept_completion")
+        service_request.extra_service_request.filter(status=ServiceRequestStatusChoices.COMPLETED_BY_PROVIDER).update(
+            status=ServiceRequestStatusChoices.COMPLETED, updated=service_request.updated
+        )
+        ServiceProviderInbox.objects.refresh_status(
+            [service_request.id] + list(service_request.extra_service_request.values_list("id", flat=True))
+        )
+        if service_request.assigned_service_provider_id:
+            if not service_request.parent_id:
+                ServiceProviderStats.objects.record(
+                    service_request.assigned_service_provider_id, service_request, completed=1
+                )
+            notify(
+                "request_completed_by_client", service_request, [service_request.assigned_service_provider.user_id]
+            )
+        return Response({"message": "Request marked as completed successfully."})
 
 
+    @transaction.atomic
     @action(url_path="mark-inprogress", detail=True, methods=["PATCH"])    
     def inprogress(self, request, pk, *args, **kwargs):
-        service_request = self.get_object()
-        if service_request.status==ServiceRequestStatusChoices.ACCEPTED:
-            service_request.status = ServiceRequestStatusChoices.INPROGRESS
-            service_request.save()
-            return Response({"message": "Request marked as started successfully."})
-        request_started.delay(service_request.id)
-        raise ValidationError({"status": "Request is not approved."})
+        service_request = apply_transition(self.get_object(), "mark_inprogress")
+        ServiceProviderInbox.objects.refresh_status([service_request.id])
+        notify("request_started", service_request, service_request.assign.values_list("id", flat=True))
+        return Response({"message": "Request marked as started successfully."})
 
     
     @action(url_path="reschedule", detail=True, methods=["PATCH"])    
@@ -445,20 +546,24 @@ class ServiceRequestViewSet(ModelViewSet):
         ser.save()
         return Response(ser.data)
         
+    @transaction.atomic
     @action(url_path="assign", detail=True, methods=["PATCH"])    
     def assign(self, request, pk, *args, **kwargs):
         service_request = self.get_object()
         ser = ServiceRequestAssignSerializer(data=request.data)
         ser.is_valid(raise_exception=True)
         service_request.assign.add(*ser.validated_data["assign"])
-        request_assigned.delay(service_request.id, [a.id for a in ser.validated_data["assign"]])
+        ServiceRequest.objects.touch([service_request.id])
+        notify("request_assigned", service_request, [a.id for a in ser.validated_data["assign"]])
         return Response({"message": "Employee assigned on given request."})
 
-    @transaction.atomic
     @action(url_path="get-payment-url", detail=True, methods=["POST"])    
     def get_payment_url(self, request, pk, *args, **kwargs):
         service_request = self.get_object()
-        return Response({"payment_url": ServiceFeaturerViewSet._pay(request, service_request).payment_url})
+        payment_obj = ServiceFeaturerViewSet._pay(request, service_request)
+        if not type(payment_obj)==ServiceRequestPayment:
+            return payment_obj
+        return Response({"payment_url": payment_obj.payment_url})
 
 class ServiceRequestRatingViewSet(ModelViewSet):
     serializer_class = ServiceRequestRatingSerializer
@@ -467,3 +572,34 @@ class ServiceRequestRatingViewSet(ModelViewSet):
         return ServiceRequestRating.objects.all()
 
     
+
+
+class ServiceRequestPaymentCallbackView(APIView):
+    """
+    Target of the gateway's callback and error redirects. The status is always read back from the
+    gateway, and settling is idempotent, so repeated deliveries are harmless.
+    """
+    permission_classes = (permissions.AllowAny, )
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params if request.method == "GET" else request.data
+        if params.get("invoice_id"):
+            key, key_type = params["invoice_id"], "InvoiceId"
+        elif params.get("paymentId"):
+            key, key_type = params["paymentId"], "PaymentId"
+        else:
+            raise ValidationError({"invoice_id": "This field is required."})
+        try:
+            invoice_id, invoice_status = get_payment_gateway().get_status(key, key_type)
+        except PaymentGatewayError:
+            return Response({"payment": "Payment status unavailable."}, status=status.HTTP_502_BAD_GATEWAY)
+        settle_invoices({invoice_id: invoice_status})
+        payment = ServiceRequestPayment.objects.filter(invoice_id=invoice_id).values(
+            "service_request_id", "status"
+        ).first()
+        if not payment:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response({"invoice_id": invoice_id, "invoice_status": invoice_status, **payment})
+
+    def post(self, request, *args, **kwargs):
+        return self.get(request, *args, **kwargs)
@@ -82,6 +82,9 @@ AUTH_USER_MODEL = 'users.User'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Build every advertise vertical's ModelForm class at startup instead of on first use.
+WARM_UP_AD_FORMS = not DEBUG
+
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
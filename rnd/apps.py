@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RndConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rnd'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
+        if getattr(settings, 'WARM_UP_AD_FORMS', False):
+            from .forms import warm_up_forms
+            warm_up_forms()
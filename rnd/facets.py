@@ -0,0 +1,114 @@
+import decimal
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Case, CharField, Count, Value, When
+
+from advertise.models.category_model import CityChoice
+from .models import AdSearchDocument, Category
+
+PRICE_BUCKETS = [0, 1000, 5000, 10000, 50000, 100000]
+FACETS = ('category', 'city', 'price', 'condition')
+FACET_CACHE_TIMEOUT = 60 * 10
+GENERATION_KEY = 'ad_facets:generation:{}'
+INTEGER_FILTERS = ('category', 'content_type')
+DECIMAL_FILTERS = ('min_price', 'max_price')
+
+
+def _price_bucket_expression():
+    whens = []
+    for low, high in zip(PRICE_BUCKETS, PRICE_BUCKETS[1:]):
+        whens.append(When(price__gte=low, price__lt=high, then=Value(f'{low}-{high}')))
+    return Case(*whens, default=Value(f'{PRICE_BUCKETS[-1]}+'), output_field=CharField())
+
+
+FACET_GROUPINGS = {
+    'category': lambda qs: qs.exclude(category=None).values_list('category_id'),
+    'city': lambda qs: qs.filter(location__in=CityChoice.values).values_list('location'),
+    'price': lambda qs: qs.annotate(price_bucket=_price_bucket_expression()).values_list('price_bucket'),
+    'condition': lambda qs: qs.exclude(attributes__condition=None).values_list('attributes__condition'),
+}
+
+
+def clean_filters(filters):
+    """The browse filters with blanks dropped; raises ValidationError for ids and prices that are not numbers."""
+    filters = {key: str(value) for key, value in filters.items() if value not in (None, '')}
+    errors = {}
+    for key in INTEGER_FILTERS:
+        if key in filters and not filters[key].isdigit():
+            errors[key] = ['Enter a whole number.']
+    for key in DECIMAL_FILTERS:
+        if key in filters:
+            try:
+                valid = decimal.Decimal(filters[key]).is_finite()
+            except decimal.InvalidOperation:
+                valid = False
+            if not valid:
+                errors[key] = ['Enter a number.']
+    if errors:
+        raise ValidationError(errors)
+    return filters
+
+
+def filter_documents(filters):
+    """Apply the browse filters (all optional) to the search documents."""
+    qs = AdSearchDocument.objects.filter(availability=True)
+    if filters.get('category'):
+        category = Category.objects.filter(id=filters['category']).first()
+        qs = qs.filter(category_path__startswith=category.get_path()) if category else qs.none()
+    if filters.get('content_type'):
+        qs = qs.filter(content_type_id=filters['content_type'])
+    if filters.get('city'):
+        qs = qs.filter(location=filters['city'])
+    if filters.get('min_price'):
+        qs = qs.filter(price__gte=filters['min_price'])
+    if filters.get('max_price'):
+        qs = qs.filter(price__lte=filters['max_price'])
+    if filters.get('condition'):
+        qs = qs.filter(attributes__condition=filters['condition'])
+    return qs
+
+
+def _generation(scope):
+    return cache.get_or_set(GENERATION_KEY.format(scope), 1, timeout=None)
+
+
+def _bump(scope):
+    key = GENERATION_KEY.format(scope)
+    if not cache.add(key, 2, timeout=None):
+        cache.incr(key)
+
+
+def invalidate_facets(content_type_id=None):
+    """
+    Expire the cached counts a change to an ad of ``content_type_id`` can affect: the unscoped
+    counts and the counts scoped to that vertical. Without a content type everything is expired.
+    """
+    if content_type_id:
+        _bump('all')
+        _bump(content_type_id)
+    else:
+        _bump('epoch')
+
+
+def get_facet_counts(filters, facets=FACETS):
+    """
+    ``{facet: {value: count}}`` for the filtered documents, one grouped query per facet, cached per
+    filter set. Raises ValidationError for malformed filters (see clean_filters).
+    """
+    filters = clean_filters(filters)
+    facets = [facet for facet in facets if facet in FACET_GROUPINGS]
+    scope = filters.get('content_type', 'all')
+    signature = hashlib.md5(json.dumps([filters, facets], sort_keys=True).encode()).hexdigest()
+    cache_key = f"ad_facets:{_generation('epoch')}:{scope}:{_generation(scope)}:{signature}"
+    counts = cache.get(cache_key)
+    if counts is None:
+        qs = filter_documents(filters).order_by()
+        counts = {}
+        for facet in facets:
+            grouped = FACET_GROUPINGS[facet](qs).annotate(count=Count('id'))
+            counts[facet] = {str(value): count for value, count in grouped}
+        cache.set(cache_key, counts, FACET_CACHE_TIMEOUT)
+    return counts
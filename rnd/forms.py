@@ -1,5 +1,10 @@
+from functools import lru_cache
+
 from django import forms
+from django.apps import apps
+
 from .models import Category, BaseAdvertise
+from .choices import CategoryKeywordChoice
 
 
 class AdvertiseForm(forms.ModelForm):
@@ -7,3 +12,22 @@ class AdvertiseForm(forms.ModelForm):
     class Meta:
         model = BaseAdvertise
         exclude = ('user', 'category', 'availability', 'content_type', 'object_id')
+
+
+@lru_cache(maxsize=None)
+def get_form(a):
+    """ModelForm class for the advertise vertical ``a``, built once per model and reused afterwards."""
+    class MyForm(forms.ModelForm):
+        class Meta:
+            model = a
+            fields = '__all__'
+    return MyForm
+
+
+def warm_up_forms():
+    """Build the form class of every vertical model a category keyword can point at."""
+    for keyword in CategoryKeywordChoice.values:
+        try:
+            get_form(apps.get_model(app_label='advertise', model_name=keyword))
+        except LookupError:
+            pass
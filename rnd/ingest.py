@@ -0,0 +1,133 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+
+from .facets import invalidate_facets
+from .forms import AdvertiseForm, get_form
+from .models import AdSearchDocument, BaseAdvertise
+from .search import get_search_backend
+
+
+class MalformedRow:
+    """Stands in for a line that could not be parsed, so the importer reports it like an invalid row."""
+
+    def __init__(self, error):
+        self.errors = {'__all__': [error]}
+
+
+def iter_rows(stream, format='csv'):
+    """
+    Yield ``(line_number, row)`` one at a time from a CSV (with header) or JSON Lines text stream.
+    A JSON line that does not parse to an object is yielded as a MalformedRow.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as err:
+                row = MalformedRow(f'Invalid JSON: {err}')
+            else:
+                if not isinstance(row, dict):
+                    row = MalformedRow('Expected a JSON object.')
+            yield line_number, row
+    else:
+        raise ValueError(f'Unsupported format: {format}')
+
+
+def can_bulk_create(model):
+    # vertical primary keys are needed for the ads' object_id, and bulk_create only sets them where
+    # the backend returns them, and never for multi-table inherited models such as the Classified verticals
+    return connection.features.can_return_rows_from_bulk_insert and not model._meta.parents
+
+
+class AdImporter:
+    """
+    Validates rows of one advertise vertical with its cached form and writes them in chunked
+    transactions. Invalid rows are reported through ``on_error(line_number, errors)`` and skipped.
+    """
+
+    def __init__(self, model, category, user=None, chunk_size=500, on_error=None):
+        self.model = model
+        self.category = category
+        self.user = user
+        self.chunk_size = chunk_size
+        self.on_error = on_error or (lambda line_number, errors: None)
+        self.form_class = get_form(model)
+        self.content_type = ContentType.objects.get_for_model(model)
+        self.created = 0
+        self.failed = 0
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+        return self.created, self.failed
+
+    def _validate(self, chunk):
+        valid = []
+        for line_number, row in chunk:
+            if isinstance(row, MalformedRow):
+                self.failed += 1
+                self.on_error(line_number, row.errors)
+                continue
+            vertical_form = self.form_class(row)
+            advertise_form = AdvertiseForm(row)
+            if vertical_form.is_valid() and advertise_form.is_valid():
+                valid.append((vertical_form.save(commit=False), advertise_form.save(commit=False)))
+            else:
+                self.failed += 1
+                self.on_error(line_number, {**vertical_form.errors, **advertise_form.errors})
+        return valid
+
+    def _import_chunk(self, chunk):
+        valid = self._validate(chunk)
+        if not valid:
+            return
+        with transaction.atomic():
+            verticals = [vertical for vertical, _ in valid]
+            if can_bulk_create(self.model):
+                self.model.objects.bulk_create(verticals)
+            else:
+                for vertical in verticals:
+                    vertical.save()
+            advertises = []
+            for vertical, advertise in valid:
+                advertise.content_type = self.content_type
+                advertise.object_id = vertical.pk
+                advertise.category = self.category
+                advertise.user = self.user
+                advertises.append(advertise)
+            BaseAdvertise.objects.bulk_create(advertises)
+            if advertises[0].pk is None:
+                # every vertical row in the chunk is new and owns exactly one ad, so the generic key
+                # finds the ids the backend did not return
+                ids = dict(BaseAdvertise.objects.filter(
+                    content_type=self.content_type, object_id__in=[vertical.pk for vertical in verticals]
+                ).values_list('object_id', 'id'))
+                for advertise in advertises:
+                    advertise.id = ids[advertise.object_id]
+            self._index(advertises, verticals)
+        self.created += len(valid)
+
+    def _index(self, advertises, verticals):
+        # bulk_create skips post_save, so do the BaseAdvertise signal handlers' work once per chunk
+        category_path = self.category.get_path() if self.category else ''
+        documents = []
+        for advertise, vertical in zip(advertises, verticals):
+            advertise.content_object = vertical
+            documents.append(AdSearchDocument.objects.build(advertise, category_path=category_path))
+        AdSearchDocument.objects.bulk_create(documents)
+        get_search_backend().index_many(advertises)
+        invalidate_facets(self.content_type.id)
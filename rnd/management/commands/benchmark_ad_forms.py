@@ -0,0 +1,32 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from rnd.forms import get_form
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request vertical form construction with and without the form class cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default='Car')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        model = apps.get_model(app_label='advertise', model_name=options['model'])
+        iterations = options['iterations']
+        data = {'title': 'bench'}
+        uncached = self._time(lambda: get_form.__wrapped__(model)(data), iterations)
+        get_form(model)
+        cached = self._time(lambda: get_form(model)(data), iterations)
+        self.stdout.write(f'{model.__name__}: {len(model._meta.fields)} fields')
+        self.stdout.write(f'class built per request  {uncached * 1e6:9.1f} us/request')
+        self.stdout.write(f'cached form class        {cached * 1e6:9.1f} us/request ({uncached / cached:.1f}x faster)')
+
+    @staticmethod
+    def _time(build, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            build()
+        return (time.perf_counter() - started) / iterations
@@ -0,0 +1,75 @@
+import csv
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from advertise.models import Car
+from rnd.forms import AdvertiseForm, get_form
+from rnd.ingest import AdImporter, iter_rows
+from rnd.models import Category
+
+CAR_FIELDS = ['title', 'description', 'price', 'location', 'brand', 'model', 'regional_specs', 'body_condition',
+              'mechanic_condition', 'doors', 'no_of_cylinder', 'horse_power', 'transmission_type', 'year', 'mileage']
+
+
+def car_row(rng, index):
+    return {
+        'title': f'Car {index}', 'description': 'Imported dealer stock', 'price': rng.randint(1000, 90000),
+        'location': 'Adama', 'brand': rng.choice(['Toyota', 'Nissan', 'Suzuki']), 'model': 'X',
+        'regional_specs': 'GCC', 'body_condition': 'good', 'mechanic_condition': 'good',
+        # every 50th row is rejected to exercise the error path
+        'doors': 0 if index % 50 == 0 else 4, 'no_of_cylinder': '4', 'horse_power': '120',
+        'transmission_type': 'manual', 'year': rng.randint(1995, 2021), 'mileage': rng.randint(0, 300000),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measure Car feed import throughput against the one-ad-per-request path. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        with tempfile.NamedTemporaryFile('w+', suffix='.csv', newline='') as feed:
+            writer = csv.DictWriter(feed, fieldnames=CAR_FIELDS)
+            writer.writeheader()
+            for index in range(options['rows']):
+                writer.writerow(car_row(rng, index))
+            feed.flush()
+
+            with transaction.atomic():
+                category = Category.objects.create(name='bench-cars', keyword='Car')
+                feed.seek(0)
+                importer = AdImporter(Car, category, chunk_size=options['chunk_size'])
+                started = time.perf_counter()
+                created, failed = importer.run(iter_rows(feed))
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'bulk import      {created / elapsed:9.0f} rows/sec ({created} created, {failed} rejected)')
+
+                feed.seek(0)
+                started = time.perf_counter()
+                created = self._per_row(iter_rows(feed), category)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'one per request  {created / elapsed:9.0f} rows/sec ({created} created)')
+                transaction.set_rollback(True)
+
+    @staticmethod
+    def _per_row(rows, category):
+        created = 0
+        for _, row in rows:
+            # mirrors CreateAd.post: one transaction for the vertical row, one for the ad
+            model_form = get_form(Car)(row)
+            if model_form.is_valid() and AdvertiseForm(row).is_valid():
+                with transaction.atomic():
+                    obj = model_form.save()
+                with transaction.atomic():
+                    obj.base_advertise.create(object_id=obj.id, title=row['title'], price=row['price'],
+                                              description=row['description'], location=row['location'],
+                                              category=category)
+                created += 1
+        return created
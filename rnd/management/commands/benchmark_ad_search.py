@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from advertise.models import Car
+from rnd.models import BaseAdvertise
+from rnd.search import get_search_backend
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'de', 'ba', 'go', 'zu', 'fe', 'po', 'ha', 'ji']
+
+
+class Command(BaseCommand):
+    help = 'Measure full-text relevance and latency against an icontains scan on synthetic ads. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ads', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = sorted({''.join(rng.choices(SYLLABLES, k=4)) for _ in range(3000)})
+        backend = get_search_backend()
+        with transaction.atomic():
+            titles = self._load_ads(options['ads'], vocabulary, rng, backend)
+            # each query is two words from one ad's title; that ad is the one a good ranking puts first
+            queries = []
+            for advertise_id in rng.sample(list(titles), options['queries']):
+                queries.append((advertise_id, rng.sample(titles[advertise_id], 2)))
+            self._report('full-text', queries, lambda terms: [
+                advertise_id for advertise_id, _ in backend.search_ids(' '.join(terms), limit=10)
+            ])
+            self._report('full-text prefix', queries, lambda terms: [
+                advertise_id for advertise_id, _ in backend.search_ids(' '.join(term[:5] for term in terms), limit=10)
+            ])
+            self._report('icontains scan', queries, self._icontains)
+            transaction.set_rollback(True)
+
+    def _load_ads(self, count, vocabulary, rng, backend):
+        started = time.perf_counter()
+        content_type = ContentType.objects.get_for_model(Car)
+        first_id = (BaseAdvertise.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        titles = {}
+        batch = []
+        for advertise_id in range(first_id, first_id + count):
+            title_words = rng.sample(vocabulary, 4)
+            titles[advertise_id] = title_words
+            batch.append(BaseAdvertise(
+                id=advertise_id, title=' '.join(title_words), description=' '.join(rng.choices(vocabulary, k=30)),
+                price=rng.randint(100, 100000), location='', content_type=content_type, object_id=advertise_id,
+            ))
+            if len(batch) == 1000:
+                self._flush(batch, backend)
+                batch = []
+        self._flush(batch, backend)
+        self.stdout.write(f'Loaded and indexed {count} ads in {time.perf_counter() - started:.1f}s '
+                          f'with {type(backend).__name__}')
+        return titles
+
+    @staticmethod
+    def _flush(batch, backend):
+        BaseAdvertise.objects.bulk_create(batch)
+        backend.index_many(batch)
+
+    @staticmethod
+    def _icontains(terms):
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(description__icontains=term)
+        return list(BaseAdvertise.objects.filter(condition).values_list('id', flat=True)[:10])
+
+    def _report(self, label, queries, run):
+        timings = []
+        reciprocal_ranks = []
+        for advertise_id, terms in queries:
+            started = time.perf_counter()
+            found = run(terms)
+            timings.append((time.perf_counter() - started) * 1000)
+            reciprocal_ranks.append(1 / (found.index(advertise_id) + 1) if advertise_id in found else 0)
+        timings.sort()
+        self.stdout.write(
+            f'{label:<18} p50 {statistics.median(timings):8.2f} ms  p95 {timings[int(len(timings) * 0.95) - 1]:8.2f} ms  '
+            f'MRR@10 {statistics.mean(reciprocal_ranks):.2f}'
+        )
@@ -0,0 +1,83 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from rnd.models import Category, CategoryClosure
+
+
+def adjacency_ancestors(category):
+    ancestors = []
+    while category.parent_id:
+        category = Category.objects.get(id=category.parent_id)
+        ancestors.append(category)
+    return ancestors[::-1]
+
+
+def adjacency_descendants(category):
+    descendants = []
+    level = [category.id]
+    while level:
+        children = list(Category.objects.filter(parent_id__in=level))
+        descendants += children
+        level = [child.id for child in children]
+    return descendants
+
+
+class Command(BaseCommand):
+    help = 'Compare parent-link and closure-table lookups on a synthetic category tree. All data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=10000)
+        parser.add_argument('--fanout', type=int, default=6)
+        parser.add_argument('--samples', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            leaves, roots = self._build_tree(options['nodes'], options['fanout'])
+            samples = options['samples']
+            self._report('ancestors (parent links)', adjacency_ancestors, random.choices(leaves, k=samples))
+            self._report('ancestors (closure)', lambda c: list(c.get_ancestors()), random.choices(leaves, k=samples))
+            self._report('descendants (parent links)', adjacency_descendants, roots)
+            self._report('descendants (closure)', lambda c: list(c.get_descendants()), roots)
+            transaction.set_rollback(True)
+
+    def _build_tree(self, nodes, fanout):
+        started = time.perf_counter()
+        root = Category.objects.create(name='bench-root')
+        next_id = root.id + 1
+        level = [root]
+        roots = [root]
+        created = 1
+        while created < nodes:
+            next_level = []
+            for parent in level:
+                batch = min(fanout, nodes - created)
+                # explicit ids, since bulk_create does not return primary keys on every backend
+                next_level += [
+                    Category(id=next_id + i, name=f'bench-{next_id + i}', parent=parent, depth=parent.depth + 1)
+                    for i in range(batch)
+                ]
+                next_id += batch
+                created += batch
+                if created >= nodes:
+                    break
+            Category.objects.bulk_create(next_level, batch_size=1000)
+            if len(roots) == 1:
+                roots += next_level
+            level = next_level
+        CategoryClosure.objects.rebuild()
+        self.stdout.write(f'Built {created} categories, max depth {level[-1].depth}, '
+                          f'in {time.perf_counter() - started:.2f}s')
+        return level, roots
+
+    def _report(self, label, lookup, categories):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for category in categories:
+                lookup(category)
+            elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label:<28} {elapsed / len(categories) * 1000:8.3f} ms/lookup '
+                          f'{len(queries) / len(categories):6.1f} queries/lookup')
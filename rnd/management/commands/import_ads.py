@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rnd.ingest import AdImporter, iter_rows
+from rnd.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Import a dealer/agency feed of one vertical from CSV or JSON Lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--category', type=int, required=True, help='Category id; its keyword selects the vertical.')
+        parser.add_argument('--user', type=int, help='Id of the user the ads are posted as.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            category = Category.objects.get(id=options['category'])
+            model = apps.get_model(app_label='advertise', model_name=category.keyword)
+        except (Category.DoesNotExist, LookupError) as err:
+            raise CommandError(err)
+        user = get_user_model().objects.get(id=options['user']) if options['user'] else None
+
+        def report_error(line_number, errors):
+            self.stderr.write(f'line {line_number}: {dict(errors)}')
+
+        importer = AdImporter(model, category, user=user, chunk_size=options['chunk_size'], on_error=report_error)
+        with open(options['path'], newline='') as stream:
+            created, failed = importer.run(iter_rows(stream, options['format']))
+        self.stdout.write(self.style.SUCCESS(f'Imported {created} {model.__name__} ads, {failed} rows rejected.'))
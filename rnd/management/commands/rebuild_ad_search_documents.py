@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rnd.models import BaseAdvertise, AdSearchDocument
+from rnd.facets import invalidate_facets
+
+
+class Command(BaseCommand):
+    help = 'Build the ad search documents for existing ads in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        category_paths = {}
+        last_id = 0
+        total = 0
+        while True:
+            batch = list(BaseAdvertise.objects.feed().filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            documents = []
+            for advertise in batch:
+                if advertise.category_id and advertise.category_id not in category_paths:
+                    category_paths[advertise.category_id] = advertise.category.get_path()
+                documents.append(AdSearchDocument.objects.build(
+                    advertise, category_path=category_paths.get(advertise.category_id, '')
+                ))
+            with transaction.atomic():
+                AdSearchDocument.objects.filter(advertise__in=batch).delete()
+                AdSearchDocument.objects.bulk_create(documents)
+            last_id = batch[-1].id
+            total += len(batch)
+            self.stdout.write(f'{total} documents built')
+        invalidate_facets()
+        self.stdout.write(self.style.SUCCESS(f'Built {total} ad search documents.'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from rnd.models import BaseAdvertise
+from rnd.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text index over advertise titles and descriptions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        with transaction.atomic():
+            backend.clear()
+            while True:
+                batch = list(BaseAdvertise.objects.only('id', 'title', 'description').filter(
+                    id__gt=last_id).order_by('id')[:batch_size])
+                if not batch:
+                    break
+                backend.index_many(batch)
+                last_id = batch[-1].id
+                total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} ads with {type(backend).__name__}.'))
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 13:32
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('rnd', '0004_category_closure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('category_path', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('title', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=16)),
+                ('location', models.CharField(blank=True, max_length=100)),
+                ('availability', models.BooleanField(default=True)),
+                ('attributes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('advertise', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='rnd.baseadvertise')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='rnd.category')),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='adsearchdocument',
+            index=models.Index(fields=['content_type', 'price'], name='rnd_adsearc_content_f894df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adsearchdocument',
+            index=models.Index(fields=['content_type', 'object_id'], name='rnd_adsearc_content_94fcc5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adsearchdocument',
+            index=models.Index(fields=['availability', 'price'], name='rnd_adsearc_availab_385072_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE rnd_advertise_fts USING fts5(title, description, tokenize='unicode61')"
+        )
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE rnd_advertise_fts ('
+            'advertise_id bigint PRIMARY KEY REFERENCES rnd_baseadvertise (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX rnd_advertise_fts_document_idx ON rnd_advertise_fts USING GIN (document)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS rnd_advertise_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rnd', '0005_ad_search_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.core.serializers.json import DjangoJSONEncoder
 from django.urls import reverse
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
@@ -19,6 +20,47 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored parent so save() can tell when the node was moved
+        instance._loaded_parent_id = instance.parent_id
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self._state.adding
+        parent_changed = not is_new and getattr(self, '_loaded_parent_id', self.parent_id) != self.parent_id
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                CategoryClosure.objects.insert_node(self)
+            elif parent_changed:
+                CategoryClosure.objects.move_subtree(self)
+                AdSearchDocument.objects.refresh_category_paths(self.get_descendants(include_self=True))
+                # category facet counts and category filters follow the closure
+                from .facets import invalidate_facets
+                transaction.on_commit(invalidate_facets)
+        self._loaded_parent_id = self.parent_id
+
+    def get_ancestors(self, include_self=False):
+        """Root-first ancestors of this category, fetched in a single query."""
+        min_depth = 0 if include_self else 1
+        return Category.objects.filter(
+            descendant_links__descendant=self, descendant_links__depth__gte=min_depth
+        ).order_by('-descendant_links__depth')
+
+    def get_path(self):
+        """Materialized ``/root/.../self/`` id path, used to match every ad under a category by prefix."""
+        return '/' + ''.join(f'{category_id}/' for category_id in self.get_ancestors(include_self=True).values_list(
+            'id', flat=True))
+
+    def get_descendants(self, include_self=False):
+        """Every category below this one at any depth, fetched in a single query."""
+        min_depth = 0 if include_self else 1
+        return Category.objects.filter(
+            ancestor_links__ancestor=self, ancestor_links__depth__gte=min_depth
+        ).order_by('ancestor_links__depth', 'id')
+
     # def get_update_url(self):
     #     return reverse("categories", kwargs={"pk": self.id})
 
@@ -26,6 +68,92 @@ class Category(models.Model):
         verbose_name_plural = 'Categories'
 
 
+class CategoryClosureManager(models.Manager):
+
+    def insert_node(self, category):
+        rows = [self.model(ancestor_id=category.id, descendant_id=category.id, depth=0)]
+        if category.parent_id:
+            rows += [
+                self.model(ancestor_id=ancestor_id, descendant_id=category.id, depth=depth + 1)
+                for ancestor_id, depth in self.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+            ]
+        self.bulk_create(rows)
+
+    def move_subtree(self, category):
+        subtree = list(self.filter(ancestor_id=category.id).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        # detach the subtree from its old ancestors, keeping its internal links
+        self.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if not category.parent_id:
+            return
+        ancestors = list(self.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth'))
+        self.bulk_create([
+            self.model(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + depth + 1)
+            for ancestor_id, ancestor_depth in ancestors
+            for descendant_id, depth in subtree
+        ], batch_size=1000)
+
+    @transaction.atomic
+    def rebuild(self, batch_size=1000):
+        """Recreate every closure row from the ``parent`` links. Returns the number of rows written."""
+        self.all().delete()
+        children = {}
+        for category_id, parent_id in Category.objects.values_list('id', 'parent_id'):
+            children.setdefault(parent_id, []).append(category_id)
+        known_ids = {category_id for siblings in children.values() for category_id in siblings}
+        rows = []
+        written = 0
+        # walk down from the roots carrying each node's root-first ancestor path; a parent that
+        # no longer exists (parent is DO_NOTHING) makes its children roots
+        stack = [
+            (category_id, [])
+            for parent_id, siblings in children.items() if parent_id is None or parent_id not in known_ids
+            for category_id in siblings
+        ]
+        while stack:
+            category_id, path = stack.pop()
+            path = path + [category_id]
+            for depth, ancestor_id in enumerate(reversed(path)):
+                rows.append(self.model(ancestor_id=ancestor_id, descendant_id=category_id, depth=depth))
+            stack.extend((child_id, path) for child_id in children.get(category_id, []))
+            if len(rows) >= batch_size:
+                self.bulk_create(rows, batch_size=batch_size)
+                written += len(rows)
+                rows = []
+        self.bulk_create(rows, batch_size=batch_size)
+        from .facets import invalidate_facets
+        transaction.on_commit(invalidate_facets)
+        return written + len(rows)
+
+
+class CategoryClosure(models.Model):
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    objects = CategoryClosureManager()
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    class Meta:
+        unique_together = ('ancestor', 'descendant')
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+
+class BaseAdvertiseQuerySet(models.QuerySet):
+
+    def feed(self):
+        """
+        Ads with their vertical detail rows attached as ``content_object``.
+        The detail rows are loaded with one ``IN`` query per distinct content type, so a page costs
+        a fixed number of queries however many ads it holds.
+        """
+        return self.select_related('category', 'user').prefetch_related('content_object')
+
+
 class BaseAdvertise(models.Model):
     user = models.ForeignKey(User, on_delete=models.DO_NOTHING, related_name="posted_user", blank=True,
                              null=True)
@@ -40,6 +168,8 @@ class BaseAdvertise(models.Model):
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
 
+    objects = BaseAdvertiseQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.category}: {self.title}"
 
@@ -51,3 +181,79 @@ class Favourite(models.Model):
                                  null=True)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
+
+
+class AdSearchDocumentManager(models.Manager):
+
+    def build(self, advertise, category_path=None):
+        """Unsaved document for ``advertise``; pass ``category_path`` to skip the closure lookup."""
+        if category_path is None:
+            category_path = advertise.category.get_path() if advertise.category_id else ''
+        return self.model(
+            advertise=advertise,
+            content_type_id=advertise.content_type_id,
+            object_id=advertise.object_id,
+            category_id=advertise.category_id,
+            category_path=category_path,
+            title=advertise.title,
+            price=advertise.price,
+            location=advertise.location,
+            availability=advertise.availability,
+            attributes=self.model.get_attributes(advertise.content_object),
+        )
+
+    def sync(self, advertise):
+        document = self.build(advertise)
+        values = {field.attname: getattr(document, field.attname) for field in self.model._meta.concrete_fields
+                  if not field.primary_key and field.name != 'advertise'}
+        self.update_or_create(advertise=advertise, defaults=values)
+
+    def sync_vertical(self, instance):
+        for advertise in BaseAdvertise.objects.filter(
+                content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk
+        ).select_related('category'):
+            advertise.content_object = instance
+            self.sync(advertise)
+
+    def refresh_category_paths(self, categories):
+        for category in categories:
+            self.filter(category=category).update(category_path=category.get_path())
+
+
+class AdSearchDocument(models.Model):
+    """
+    Flattened copy of a BaseAdvertise and its vertical detail row, so cross-vertical filtering
+    is a scan of one indexed table instead of a generic join per vertical.
+    """
+    advertise = models.OneToOneField(BaseAdvertise, on_delete=models.CASCADE, related_name='search_document')
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True)
+    category_path = models.CharField(max_length=255, blank=True, db_index=True)
+    title = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=16, decimal_places=2)
+    location = models.CharField(max_length=100, blank=True)
+    availability = models.BooleanField(default=True)
+    attributes = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    objects = AdSearchDocumentManager()
+
+    def __str__(self):
+        return self.title
+
+    @staticmethod
+    def get_attributes(vertical):
+        if vertical is None:
+            return {}
+        return {
+            field.name: field.value_from_object(vertical)
+            for field in vertical._meta.concrete_fields
+            if not (field.primary_key or field.is_relation)
+        }
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'price']),
+            models.Index(fields=['content_type', 'object_id']),
+            models.Index(fields=['availability', 'price']),
+        ]
@@ -0,0 +1,162 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import BaseAdvertise
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+FTS_TABLE = 'rnd_advertise_fts'
+
+
+def tokenize(query):
+    return [token.lower() for token in TOKEN_RE.findall(query or '')]
+
+
+class BaseSearchBackend:
+    """
+    Full-text index over BaseAdvertise.title/description. The index lives in ``FTS_TABLE``
+    (created by migration rnd.0006) keyed by the advertise id.
+    """
+
+    def index(self, advertise):
+        self.index_many([advertise])
+
+    def index_many(self, advertises):
+        raise NotImplementedError
+
+    def remove(self, advertise_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE {self.key_column} = %s', [advertise_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    def search_ids(self, query, limit=20):
+        """``[(advertise_id, score), ...]`` best match first. Every term is prefix matched."""
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table, ranked by bm25 with the title weighted above the description."""
+    key_column = 'rowid'
+    title_weight = 10.0
+    description_weight = 1.0
+
+    def index_many(self, advertises):
+        rows = [(advertise.id, advertise.title, advertise.description) for advertise in advertises]
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)', rows)
+
+    def search_ids(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, bm25({FTS_TABLE}, %s, %s) AS score FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY score LIMIT %s',
+                [self.title_weight, self.description_weight, match, limit]
+            )
+            # bm25() is lower-is-better; flip it so every backend returns higher-is-better scores
+            return [(advertise_id, -score) for advertise_id, score in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector column with a GIN index, ranked by ts_rank with the title in weight class A."""
+    key_column = 'advertise_id'
+    config = 'english'
+
+    def index_many(self, advertises):
+        rows = [(advertise.id, advertise.title, advertise.description) for advertise in advertises]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (advertise_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('{self.config}', %s), 'A') || setweight(to_tsvector('{self.config}', %s), 'B')) "
+                f"ON CONFLICT (advertise_id) DO UPDATE SET document = EXCLUDED.document",
+                rows
+            )
+
+    def search_ids(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT advertise_id, ts_rank(document, query) AS score "
+                f"FROM {FTS_TABLE}, to_tsquery('{self.config}', %s) query "
+                f"WHERE document @@ query ORDER BY score DESC LIMIT %s",
+                [tsquery, limit]
+            )
+            return cursor.fetchall()
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    Fallback for databases without an ``FTS_TABLE`` (migration rnd.0006 only creates one on SQLite
+    and PostgreSQL): nothing is indexed and searches scan BaseAdvertise with LIKE, scoring title
+    matches above description matches.
+    """
+
+    def index_many(self, advertises):
+        pass
+
+    def remove(self, advertise_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def search_ids(self, query, limit=20):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        matches = BaseAdvertise.objects.all()
+        for token in tokens:
+            matches = matches.filter(Q(title__icontains=token) | Q(description__icontains=token))
+        ranked = []
+        for advertise_id, title, description in matches.values_list('id', 'title', 'description').iterator():
+            title, description = title.lower(), description.lower()
+            ranked.append((advertise_id, sum(10.0 * (token in title) + (token in description) for token in tokens)))
+        ranked.sort(key=lambda row: -row[1])
+        return ranked[:limit]
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    ``settings.AD_SEARCH_BACKEND`` (dotted path) if set, otherwise the backend for the default
+    database, falling back to LikeSearchBackend on databases without a full-text index.
+    """
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'AD_SEARCH_BACKEND', None)
+        backend_class = import_string(backend_path) if backend_path else BACKENDS.get(connection.vendor, LikeSearchBackend)
+        _backend = backend_class()
+    return _backend
+
+
+def search_ads(query, limit=20):
+    """Ads matching ``query`` best first, each with its ``search_rank`` set."""
+    ranked = get_search_backend().search_ids(query, limit=limit)
+    advertises = BaseAdvertise.objects.select_related('category').in_bulk([advertise_id for advertise_id, _ in ranked])
+    results = []
+    for advertise_id, score in ranked:
+        if advertise_id in advertises:
+            advertise = advertises[advertise_id]
+            advertise.search_rank = score
+            results.append(advertise)
+    return results
@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save, post_delete
+
+from .models import BaseAdvertise, AdSearchDocument
+from .search import get_search_backend
+from .facets import invalidate_facets
+
+
+def advertise_saved(sender, instance, **kwargs):
+    AdSearchDocument.objects.sync(instance)
+    get_search_backend().index(instance)
+    invalidate_facets(instance.content_type_id)
+
+
+def advertise_deleted(sender, instance, **kwargs):
+    get_search_backend().remove(instance.id)
+    invalidate_facets(instance.content_type_id)
+
+
+def vertical_saved(sender, instance, created, **kwargs):
+    # a new vertical row has no ads yet; CreateAd attaches the BaseAdvertise afterwards
+    if not created:
+        AdSearchDocument.objects.sync_vertical(instance)
+        invalidate_facets(ContentType.objects.get_for_model(instance).id)
+
+
+def connect_signals():
+    post_save.connect(advertise_saved, sender=BaseAdvertise, dispatch_uid='ad_search_document_advertise')
+    post_delete.connect(advertise_deleted, sender=BaseAdvertise, dispatch_uid='ad_search_index_advertise')
+    for model in apps.get_app_config('advertise').get_models():
+        if hasattr(model, 'base_advertise'):
+            post_save.connect(vertical_saved, sender=model, dispatch_uid=f'ad_search_document_{model._meta.label_lower}')
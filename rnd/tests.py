@@ -1,3 +1,107 @@
+import io
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+
+from advertise.models.classified_model import Electronics
+from advertise.models.motor_model import Car, MotorCycle
+from .facets import GENERATION_KEY
+from .ingest import AdImporter, iter_rows
+from .models import BaseAdvertise, Category
+from .search import LikeSearchBackend
+
+User = get_user_model()
+
+
+class AdvertiseFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='seller', email='seller@example.com', phone='500000000')
+        category = Category.objects.create(name='Motors')
+        for index in range(10):
+            verticals = [
+                Car.objects.create(brand='Toyota', model='Camry', regional_specs='GCC', body_condition='Good',
+                                   mechanic_condition='Good', doors=4, no_of_cylinder='4', horse_power='200',
+                                   transmission_type='Automatic'),
+                MotorCycle.objects.create(manufacturer='Honda'),
+                Electronics.objects.create(category='Phones', sub_category='Mobile', condition='New'),
+            ]
+            for vertical in verticals:
+                BaseAdvertise.objects.create(
+                    user=user, category=category, title=f'{type(vertical).__name__} {index}', description='',
+                    price=100, content_object=vertical
+                )
+
+    def test_feed_loads_mixed_verticals_with_one_query_per_content_type(self):
+        ContentType.objects.get_for_models(Car, MotorCycle, Electronics)
+        # the ads with category and user joined, then one IN query per vertical table
+        with self.assertNumQueries(4):
+            ads = list(BaseAdvertise.objects.feed())
+            verticals = [ad.content_object for ad in ads]
+            [(ad.category.name, ad.user.email) for ad in ads]
+        self.assertEqual(len(ads), 30)
+        self.assertEqual({type(vertical) for vertical in verticals}, {Car, MotorCycle, Electronics})
+        self.assertTrue(all(vertical.pk == ad.object_id for ad, vertical in zip(ads, verticals)))
+
+
+class LikeSearchBackendTests(TestCase):
+
+    def test_matches_every_term_and_ranks_title_matches_first(self):
+        user = User.objects.create(username='seller', email='seller@example.com', phone='500000000')
+        car = Car.objects.create(brand='Toyota', model='Camry', regional_specs='GCC', body_condition='Good',
+                                 mechanic_condition='Good', doors=4, no_of_cylinder='4', horse_power='200',
+                                 transmission_type='Automatic')
+        in_description = BaseAdvertise.objects.create(
+            user=user, title='Family sedan', description='Red Toyota camry', price=100, content_object=car
+        )
+        in_title = BaseAdvertise.objects.create(
+            user=user, title='Toyota Camry', description='Clean', price=100, content_object=car
+        )
+        BaseAdvertise.objects.create(user=user, title='Toyota Hilux', description='', price=100, content_object=car)
+        ranked = LikeSearchBackend().search_ids('toyota cam')
+        self.assertEqual([advertise_id for advertise_id, _ in ranked], [in_title.id, in_description.id])
+
+
+class AdFacetsTests(TestCase):
+
+    def test_non_numeric_filters_are_rejected(self):
+        response = self.client.get(reverse('ad_facets'), {'min_price': 'cheap', 'category': '1x', 'max_price': 'NaN'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'min_price', 'category', 'max_price'})
+
+    def test_moving_a_category_expires_cached_counts(self):
+        motors = Category.objects.create(name='Motors')
+        cars = Category.objects.create(name='Cars')
+        self.client.get(reverse('ad_facets'))
+        generation = cache.get(GENERATION_KEY.format('epoch'))
+        with self.captureOnCommitCallbacks(execute=True):
+            cars.parent = motors
+            cars.save()
+        self.assertNotEqual(cache.get(GENERATION_KEY.format('epoch')), generation)
+
+
+class AdImporterTests(TestCase):
 
-# Create your tests here.
+    def test_malformed_json_lines_are_reported_and_skipped(self):
+        category = Category.objects.create(name='Motorcycles', keyword='MotorCycle')
+        feed = io.StringIO(
+            '{"title": "Honda CBR", "description": "Sport bike", "price": "9000", "manufacturer": "Honda"}\n'
+            '{"title": "Broken", \n'
+            '["not", "an", "object"]\n'
+            '\n'
+            '{"title": "Yamaha R1", "description": "Track bike", "price": "12000"}\n'
+        )
+        errors = {}
+        importer = AdImporter(MotorCycle, category, on_error=lambda line_number, row_errors: errors.update({
+            line_number: row_errors
+        }))
+        created, failed = importer.run(iter_rows(feed, 'jsonl'))
+        self.assertEqual((created, failed), (2, 2))
+        self.assertEqual(sorted(errors), [2, 3])
+        self.assertEqual(
+            sorted(BaseAdvertise.objects.values_list('title', flat=True)), ['Honda CBR', 'Yamaha R1']
+        )
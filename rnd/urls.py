@@ -8,5 +8,7 @@ urlpatterns = [
     path('categories/', views.CategoryList.as_view(), name='categories'),
     path('categories/create/', views.CreateCategory.as_view(), name='create_category'),
     path('post-advertise/', views.CreateAd.as_view(), name='create_ad'),
+    path('search/', views.SearchAd.as_view(), name='search'),
+    path('facets/', views.AdFacets.as_view(), name='ad_facets'),
     path('car/<pk>/', views.CarDetail.as_view(), name='Car_detail'),
 ]
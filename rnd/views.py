@@ -1,24 +1,19 @@
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.views.generic import View, ListView, DetailView, CreateView
 from django.urls import reverse_lazy, reverse
 from django.apps import apps
-from django import forms
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 
 from .models import Category, BaseAdvertise
-from .forms import AdvertiseForm
+from .forms import AdvertiseForm, get_form
+from .search import search_ads
+from .facets import FACETS, get_facet_counts
 from advertise.models.motor_model import Motors, MotorCycle, Car, AutoAccessoriesAndParts, HeavyVehicles
 from advertise.forms import CarForm
 
 
-def get_form(a):
-    class MyForm(forms.ModelForm):
-        class Meta:
-            model = a
-            fields = '__all__'
-    return MyForm
-
-
 class CategoryList(View):
     model = Category
     template_name = 'category/category_list.html'
@@ -28,6 +23,7 @@ class CategoryList(View):
         if request.GET.get('id'):
             qs = self.model.objects.filter(parent__id=request.GET.get('id'))
             context['category'] = self.model.objects.get(id=request.GET.get('id'))
+            context['ancestors'] = context['category'].get_ancestors()
         else:
             qs = self.model.objects.filter(parent__isnull=True)
         context['object_list'] = qs
@@ -96,6 +92,30 @@ class CreateAd(View):
         return redirect('categories')
 
 
+class SearchAd(View):
+    template_name = 'category/search_results.html'
+
+    def get(self, request):
+        query = request.GET.get('search', '')
+        context = {
+            'query': query,
+            'object_list': search_ads(query, limit=50) if query else [],
+        }
+        return render(request, self.template_name, context=context)
+
+
+class AdFacets(View):
+    filter_params = ('category', 'content_type', 'city', 'min_price', 'max_price', 'condition')
+
+    def get(self, request):
+        filters = {param: request.GET.get(param) for param in self.filter_params}
+        facets = request.GET.get('facets', ','.join(FACETS)).split(',')
+        try:
+            return JsonResponse(get_facet_counts(filters, facets))
+        except ValidationError as err:
+            return JsonResponse({'errors': err.message_dict}, status=400)
+
+
 class CarDetail(DetailView):
     model = Car
     template_name = 'category/advertise_detail.html'